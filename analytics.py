@@ -0,0 +1,38 @@
+"""
+Embedded DuckDB engine for the dashboard's summary tables.
+
+Views pass the frames they already hold (cached table fetches, the lead rollup)
+to ``sql`` and describe each table as one query with ``GROUP BY`` and
+``FILTER`` clauses, instead of chains of pandas masks and merges. DuckDB scans
+the frames in place and spreads each query over all cores.
+"""
+
+from typing import Any, Dict, Optional
+
+import duckdb
+import pandas as pd
+import streamlit as st
+
+
+@st.cache_resource
+def _get_database() -> duckdb.DuckDBPyConnection:
+    # One in-memory database per process; every query runs on its own cursor
+    return duckdb.connect(database=":memory:")
+
+
+def sql(query: str, params: Optional[Dict[str, Any]] = None, **frames: pd.DataFrame) -> pd.DataFrame:
+    """Run ``query`` with each keyword DataFrame visible as a table of that name
+
+    ``params`` binds ``$name`` placeholders (timestamps may be tz-aware).
+    Categorical columns are read as ENUMs; cast them to VARCHAR when the result
+    should hold plain strings.
+    """
+    with _get_database().cursor() as cursor:
+        for name, frame in frames.items():
+            cursor.register(name, frame)
+        return cursor.execute(query, params or {}).df()
+
+
+def window_predicate(column: str, bounded: bool) -> str:
+    """SQL condition for ``column`` inside the ``$start``/``$end`` window (TRUE when unbounded)"""
+    return f"({column} BETWEEN $start AND $end)" if bounded else "TRUE"
@@ -1,6 +1,5 @@
+import functools
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
 import importlib
 AGGRID_AVAILABLE = False
 AgGrid = None
@@ -17,25 +16,22 @@ import altair as alt
 import pandas as pd
 from datetime import datetime, date, timedelta
 from auth import init_session_state, login_form, admin_user_management, require_auth, require_admin, show_sidebar_navigation
-
-# Load environment variables
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-
-@st.cache_resource
-def init_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+from data_access import EXACT_COUNT_MAX_DAYS, init_supabase, fetch_table_with_progress, fill_label, invalidate
+from kpis import fetch_kpis, kpi_value, pct_delta
+from analytics import sql, window_predicate
+from query_scheduler import run_concurrently, unwrap
+from prefetch import filter_window, start_warmer, tab_fetches
+from query_stats import begin_render, end_render, fragment_render
+from resilience import render_stale_notice
+from schema import has_column
 
 supabase = init_supabase()
+start_warmer()
+begin_render()
 
 # Initialize authentication
 init_session_state(supabase)
 
-# Fetch data
-res = supabase.table("walkin_table").select("*").execute()
-df = pd.DataFrame(res.data)
-
 # Page layout and CSS to left-align content and use full width
 st.set_page_config(page_title="Analytics Dashboard", layout="wide", initial_sidebar_state="collapsed")
 st.markdown(
@@ -105,7 +101,7 @@ if "show_user_management" in st.session_state and st.session_state.show_user_man
 st.title("Analytics Dashboard")
 
 # Global date filter (applies to KPIs and dashboards)
-col_filter_global, col_empty_filter_global = st.columns([0.2, 0.8])
+col_filter_global, col_refresh_global, col_empty_filter_global = st.columns([0.2, 0.1, 0.7], vertical_alignment="bottom")
 with col_filter_global:
     filter_option_global = st.selectbox(
         "Date filter (based on created_at)",
@@ -113,18 +109,14 @@ with col_filter_global:
         index=0,
         key="global_filter"
     )
-
-# Compute global start/end datetimes (UTC)
-now_ts_global = pd.Timestamp.now(tz="UTC")
-today_start_global = pd.Timestamp(date.today()).tz_localize("UTC")
-today_end_global = today_start_global + pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
-month_start_global = pd.Timestamp(date.today().replace(day=1)).tz_localize("UTC")
-
-if filter_option_global == "Today":
-    start_dt_global, end_dt_global = today_start_global, today_end_global
-elif filter_option_global == "MTD":
-    start_dt_global, end_dt_global = month_start_global, now_ts_global
-elif filter_option_global == "Custom Range":
+with col_refresh_global:
+    # Drop cached tables so the next fetch goes to Supabase
+    if st.button("🔄 Refresh data", use_container_width=True, key="refresh_data"):
+        invalidate()
+
+# Compute global start/end datetimes (UTC) and the previous period for delta comparison
+custom_start_global = custom_end_global = None
+if filter_option_global == "Custom Range":
     col_custom_global, col_empty_custom_global = st.columns([0.2, 0.8])
     with col_custom_global:
         col_start_global, col_end_global = st.columns(2)
@@ -132,52 +124,37 @@ elif filter_option_global == "Custom Range":
             custom_start_global = st.date_input("Start date", value=date.today().replace(day=1), key="global_start")
         with col_end_global:
             custom_end_global = st.date_input("End date", value=date.today(), key="global_end")
-    start_dt_global = pd.Timestamp(custom_start_global).tz_localize("UTC")
-    end_dt_global = pd.Timestamp(custom_end_global).tz_localize("UTC") + pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
-else:
-    start_dt_global, end_dt_global = None, None
-
-# Compute previous period for delta comparison
-prev_start_global, prev_end_global = None, None
-if filter_option_global == "MTD":
-    prev_start_global = month_start_global - pd.offsets.MonthBegin(1)
-    prev_end_global = month_start_global - pd.Timedelta(milliseconds=1)
-elif filter_option_global == "Today":
-    prev_start_global = today_start_global - pd.Timedelta(days=1)
-    prev_end_global = today_end_global - pd.Timedelta(days=1)
-elif filter_option_global == "Custom Range":
-    if start_dt_global is not None and end_dt_global is not None:
-        duration = end_dt_global - start_dt_global + pd.Timedelta(milliseconds=1)
-        prev_end_global = start_dt_global - pd.Timedelta(milliseconds=1)
-        prev_start_global = prev_end_global - duration + pd.Timedelta(milliseconds=1)
+start_dt_global, end_dt_global, prev_start_global, prev_end_global = filter_window(
+    filter_option_global, custom_start_global, custom_end_global,
+)
+
+# The Overall and CRE Performance tabs read lead_master through the daily rollup
+# (rollups.py): one row per day x basis x branch x PS x CRE x source, with
+# basis "created_at" or "ps_assigned_at" naming the timestamp the day comes from.
+# Each view keeps its basis and sums metric columns; windows start at midnight UTC
+# so whole days cover them exactly. Labels arrive as stripped categoricals (blank
+# as NaN), like every fetch_table frame
+
+# Only the open tab's body runs on a rerun (see the st.tabs call at the end). Each tab
+# dispatches its own independent fetches (prefetch.tab_fetches) concurrently; every
+# fetch is cached across reruns and sessions, so switching back to a tab recomputes it
+# from cached frames. The background warmer fills the same cache keys for the default
+# filters ahead of time.
+TAB_FETCHES = tab_fetches(start_dt_global, end_dt_global)
+
+# Filled at the end of the run with a note when any section showed stale data (resilience.py)
+stale_notice = st.empty()
 
 # KPI cards (top): All in one row
+# All nine cards are served by one cached KPI engine call (one RPC round trip for
+# exact windows, a batch of estimated count-only requests for wide ones)
+kpis = fetch_kpis(start_dt_global, end_dt_global, prev_start_global, prev_end_global)
+
 col_kpi_1, col_kpi_2, col_kpi_3, col_kpi_4, col_kpi_5, col_kpi_6, col_kpi_7, col_kpi_8, col_kpi_9 = st.columns(9)
 with col_kpi_1:
     try:
-        q = supabase.table("lead_master").select("id", count="exact")
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q = q.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        curr_resp = q.execute()
-        curr_count = int(curr_resp.count or 0)
-
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_q = (
-                supabase
-                .table("lead_master")
-                .select("id", count="exact")
-                .gte("created_at", prev_start_global.isoformat())
-                .lte("created_at", prev_end_global.isoformat())
-                .execute()
-            )
-            prev_count = int(prev_q.count or 0)
-            if prev_count == 0:
-                delta_str = "+∞%" if curr_count > 0 else "0%"
-            else:
-                pct_change = (curr_count - prev_count) / prev_count * 100.0
-                delta_str = f"{pct_change:+.1f}%"
-        else:
-            delta_str = "—"
+        curr_count = kpi_value(kpis, "leads")
+        delta_str = pct_delta(curr_count, kpi_value(kpis, "leads_prev"))
 
         st.metric(label="Leads", value=curr_count, delta=delta_str)
     except Exception as err:
@@ -185,35 +162,8 @@ with col_kpi_1:
 
 with col_kpi_2:
     try:
-        q = (
-            supabase
-            .table("lead_master")
-            .select("id", count="exact")
-            .not_.is_("cre_name", "null")
-        )
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q = q.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        curr_resp = q.execute()
-        assigned_count = int(curr_resp.count or 0)
-
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_q = (
-                supabase
-                .table("lead_master")
-                .select("id", count="exact")
-                .not_.is_("cre_name", "null")
-                .gte("created_at", prev_start_global.isoformat())
-                .lte("created_at", prev_end_global.isoformat())
-                .execute()
-            )
-            prev_assigned_count = int(prev_q.count or 0)
-            if prev_assigned_count == 0:
-                delta2 = "+∞%" if assigned_count > 0 else "0%"
-            else:
-                pct_change2 = (assigned_count - prev_assigned_count) / prev_assigned_count * 100.0
-                delta2 = f"{pct_change2:+.1f}%"
-        else:
-            delta2 = "—"
+        assigned_count = kpi_value(kpis, "assigned_cre")
+        delta2 = pct_delta(assigned_count, kpi_value(kpis, "assigned_cre_prev"))
 
         st.metric(label="Assigned to CRE", value=assigned_count, delta=delta2)
     except Exception as err:
@@ -221,42 +171,11 @@ with col_kpi_2:
 
 with col_kpi_3:
     try:
-        q = (
-            supabase
-            .table("lead_master")
-            .select("id", count="exact")
-            .not_.is_("ps_name", "null")
-        )
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q = q.gte("ps_assigned_at", start_dt_global.isoformat()).lte("ps_assigned_at", end_dt_global.isoformat())
-        curr_resp = q.execute()
-        ps_count = int(curr_resp.count or 0)
-
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_q = (
-                supabase
-                .table("lead_master")
-                .select("id", count="exact")
-                .not_.is_("ps_name", "null")
-                .gte("ps_assigned_at", prev_start_global.isoformat())
-                .lte("ps_assigned_at", prev_end_global.isoformat())
-                .execute()
-            )
-            prev_ps_count = int(prev_q.count or 0)
-            if prev_ps_count == 0:
-                delta3 = "+∞%" if ps_count > 0 else "0%"
-            else:
-                pct_change3 = (ps_count - prev_ps_count) / prev_ps_count * 100.0
-                delta3 = f"{pct_change3:+.1f}%"
-        else:
-            delta3 = "—"
-
-        # Compute total leads for percentage (use same base as Leads KPI → created_at)
-        q_total_leads_ps = supabase.table("lead_master").select("id", count="exact")
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q_total_leads_ps = q_total_leads_ps.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        total_leads_resp_ps = q_total_leads_ps.execute()
-        total_leads_count_ps = int(total_leads_resp_ps.count or 0)
+        ps_count = kpi_value(kpis, "assigned_ps")
+        delta3 = pct_delta(ps_count, kpi_value(kpis, "assigned_ps_prev"))
+
+        # Percentage of total leads (same base as Leads KPI → created_at)
+        total_leads_count_ps = kpi_value(kpis, "leads")
         ps_assigned_pct = (ps_count / total_leads_count_ps * 100.0) if total_leads_count_ps else 0.0
         pct_text_ps = f"{ps_assigned_pct:.2f}%"
 
@@ -299,35 +218,8 @@ with col_kpi_3:
 
 with col_kpi_4:
     try:
-        q = (
-            supabase
-            .table("lead_master")
-            .select("id", count="exact")
-            .eq("final_status", "Pending")
-        )
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q = q.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        curr_resp = q.execute()
-        pending_count = int(curr_resp.count or 0)
-
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_q = (
-                supabase
-                .table("lead_master")
-                .select("id", count="exact")
-                .eq("final_status", "Pending")
-                .gte("created_at", prev_start_global.isoformat())
-                .lte("created_at", prev_end_global.isoformat())
-                .execute()
-            )
-            prev_pending_count = int(prev_q.count or 0)
-            if prev_pending_count == 0:
-                delta_pend = "+∞%" if pending_count > 0 else "0%"
-            else:
-                pct_change_pend = (pending_count - prev_pending_count) / prev_pending_count * 100.0
-                delta_pend = f"{pct_change_pend:+.1f}%"
-        else:
-            delta_pend = "—"
+        pending_count = kpi_value(kpis, "pending")
+        delta_pend = pct_delta(pending_count, kpi_value(kpis, "pending_prev"))
 
         st.metric(label="Pending Leads", value=pending_count, delta=delta_pend)
     except Exception as err:
@@ -335,42 +227,11 @@ with col_kpi_4:
 
 with col_kpi_5:
     try:
-        q = (
-            supabase
-            .table("lead_master")
-            .select("id", count="exact")
-            .eq("final_status", "Lost")
-        )
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q = q.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        curr_resp = q.execute()
-        lost_count = int(curr_resp.count or 0)
-
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_q = (
-                supabase
-                .table("lead_master")
-                .select("id", count="exact")
-                .eq("final_status", "Lost")
-                .gte("created_at", prev_start_global.isoformat())
-                .lte("created_at", prev_end_global.isoformat())
-                .execute()
-            )
-            prev_lost_count = int(prev_q.count or 0)
-            if prev_lost_count == 0:
-                delta_lost = "+∞%" if lost_count > 0 else "0%"
-            else:
-                pct_change_lost = (lost_count - prev_lost_count) / prev_lost_count * 100.0
-                delta_lost = f"{pct_change_lost:+.1f}%"
-        else:
-            delta_lost = "—"
-
-        # Compute total leads for percentage
-        q_total_leads_for_lost = supabase.table("lead_master").select("id", count="exact")
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q_total_leads_for_lost = q_total_leads_for_lost.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        total_leads_resp_for_lost = q_total_leads_for_lost.execute()
-        total_leads_count_for_lost = int(total_leads_resp_for_lost.count or 0)
+        lost_count = kpi_value(kpis, "lost")
+        delta_lost = pct_delta(lost_count, kpi_value(kpis, "lost_prev"))
+
+        # Percentage of total leads
+        total_leads_count_for_lost = kpi_value(kpis, "leads")
         lost_pct = (lost_count / total_leads_count_for_lost * 100.0) if total_leads_count_for_lost else 0.0
         pct_text_lost = f"{lost_pct:.2f}%"
 
@@ -413,42 +274,11 @@ with col_kpi_5:
 
 with col_kpi_6:
     try:
-        q = (
-            supabase
-            .table("lead_master")
-            .select("id", count="exact")
-            .eq("final_status", "Won")
-        )
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q = q.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        curr_resp = q.execute()
-        won_count = int(curr_resp.count or 0)
-
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_q = (
-                supabase
-                .table("lead_master")
-                .select("id", count="exact")
-                .eq("final_status", "Won")
-                .gte("created_at", prev_start_global.isoformat())
-                .lte("created_at", prev_end_global.isoformat())
-                .execute()
-            )
-            prev_won_count = int(prev_q.count or 0)
-            if prev_won_count == 0:
-                delta_won = "+∞%" if won_count > 0 else "0%"
-            else:
-                pct_change_won = (won_count - prev_won_count) / prev_won_count * 100.0
-                delta_won = f"{pct_change_won:+.1f}%"
-        else:
-            delta_won = "—"
-
-        # Compute total leads for percentage
-        q_total_leads = supabase.table("lead_master").select("id", count="exact")
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q_total_leads = q_total_leads.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        total_leads_resp = q_total_leads.execute()
-        total_leads_count = int(total_leads_resp.count or 0)
+        won_count = kpi_value(kpis, "won")
+        delta_won = pct_delta(won_count, kpi_value(kpis, "won_prev"))
+
+        # Percentage of total leads
+        total_leads_count = kpi_value(kpis, "leads")
         won_pct = (won_count / total_leads_count * 100.0) if total_leads_count else 0.0
         pct_text_won = f"{won_pct:.2f}%"
 
@@ -491,29 +321,8 @@ with col_kpi_6:
 
 with col_kpi_7:
     try:
-        q = supabase.table("walkin_table").select("id", count="exact")
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            q = q.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-        curr_resp = q.execute()
-        walkin_count = int(curr_resp.count or 0)
-
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_q = (
-                supabase
-                .table("walkin_table")
-                .select("id", count="exact")
-                .gte("created_at", prev_start_global.isoformat())
-                .lte("created_at", prev_end_global.isoformat())
-                .execute()
-            )
-            prev_walkin_count = int(prev_q.count or 0)
-            if prev_walkin_count == 0:
-                delta_walkin = "+∞%" if walkin_count > 0 else "0%"
-            else:
-                pct_change_walkin = (walkin_count - prev_walkin_count) / prev_walkin_count * 100.0
-                delta_walkin = f"{pct_change_walkin:+.1f}%"
-        else:
-            delta_walkin = "—"
+        walkin_count = kpi_value(kpis, "walkin")
+        delta_walkin = pct_delta(walkin_count, kpi_value(kpis, "walkin_prev"))
 
         st.metric(label="Walkin Leads", value=walkin_count, delta=delta_walkin)
     except Exception as err:
@@ -521,90 +330,15 @@ with col_kpi_7:
 
 with col_kpi_8:
     try:
-        # Build Walkin Won count with robust date-column fallback: won_timestamp → updated_at → created_at
-        filter_cols_priority = ["won_timestamp", "updated_at", "created_at"]
-        walkin_won_count = 0
-        last_err = None
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            for col_name in filter_cols_priority:
-                try:
-                    q = (
-                        supabase
-                        .table("walkin_table")
-                        .select("id", count="exact")
-                        .eq("status", "Won")
-                        .gte(col_name, start_dt_global.isoformat())
-                        .lte(col_name, end_dt_global.isoformat())
-                    )
-                    curr_resp = q.execute()
-                    walkin_won_count = int(curr_resp.count or 0)
-                    last_err = None
-                    break
-                except Exception as _err:
-                    last_err = _err
-        else:
-            try:
-                curr_resp = (
-                    supabase
-                    .table("walkin_table")
-                    .select("id", count="exact")
-                    .eq("status", "Won")
-                    .execute()
-                )
-                walkin_won_count = int(curr_resp.count or 0)
-            except Exception as _err:
-                last_err = _err
-
-        # Compute conversion percentage: (Walkin Won / Total Walkins) * 100
-        # Total walkins with the same fallback
-        total_walkin_count = 0
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            for col_name in filter_cols_priority:
-                try:
-                    q_total_walkin = (
-                        supabase
-                        .table("walkin_table")
-                        .select("id", count="exact")
-                        .gte(col_name, start_dt_global.isoformat())
-                        .lte(col_name, end_dt_global.isoformat())
-                    )
-                    total_walkin_resp = q_total_walkin.execute()
-                    total_walkin_count = int(total_walkin_resp.count or 0)
-                    break
-                except Exception:
-                    continue
-        else:
-            try:
-                total_walkin_resp = supabase.table("walkin_table").select("id", count="exact").execute()
-                total_walkin_count = int(total_walkin_resp.count or 0)
-            except Exception:
-                total_walkin_count = 0
+        # Walkin Won is filtered on won_timestamp, or the next of WALKIN_WON_DATE_COLS the table has
+        walkin_won_count = int(kpis.get("walkin_won") or 0)
+
+        # Conversion percentage: (Walkin Won / Total Walkins) * 100, totals on the same date column
+        total_walkin_count = int(kpis.get("walkin_won_base") or 0)
         walkin_won_pct = (walkin_won_count / total_walkin_count * 100.0) if total_walkin_count else 0.0
 
-        if prev_start_global is not None and prev_end_global is not None:
-            prev_walkin_won_count = 0
-            for col_name in filter_cols_priority:
-                try:
-                    prev_q = (
-                        supabase
-                        .table("walkin_table")
-                        .select("id", count="exact")
-                        .eq("status", "Won")
-                        .gte(col_name, prev_start_global.isoformat())
-                        .lte(col_name, prev_end_global.isoformat())
-                        .execute()
-                    )
-                    prev_walkin_won_count = int(prev_q.count or 0)
-                    break
-                except Exception:
-                    continue
-            if prev_walkin_won_count == 0:
-                delta_walkin_won = "+∞%" if walkin_won_count > 0 else "0%"
-            else:
-                pct_change_walkin_won = (walkin_won_count - prev_walkin_won_count) / prev_walkin_won_count * 100.0
-                delta_walkin_won = f"{pct_change_walkin_won:+.1f}%"
-        else:
-            delta_walkin_won = "—"
+        prev_walkin_won_count = kpis.get("walkin_won_prev")
+        delta_walkin_won = pct_delta(walkin_won_count, None if prev_walkin_won_count is None else int(prev_walkin_won_count))
 
         # Render custom metric card so the small percent can sit inline beside the big number
         pct_text = f"{walkin_won_pct:.2f}%"
@@ -646,124 +380,110 @@ with col_kpi_8:
 
 with col_kpi_9:
     try:
-        # Count test drives from ps_followup_master with updated_at filter
-        ps_td_count = 0
-        try:
-            q_ps_td = (
-                supabase
-                .table("ps_followup_master")
-                .select("id", count="exact")
-                .eq("test_drive_done", True)
-            )
-            if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                q_ps_td = q_ps_td.gte("updated_at", start_dt_global.isoformat()).lte("updated_at", end_dt_global.isoformat())
-            ps_td_resp = q_ps_td.execute()
-            ps_td_count = int(ps_td_resp.count or 0)
-        except Exception:
-            ps_td_count = 0
-
-        # Count test drives from walkin_table with updated_at filter
-        walkin_td_count = 0
-        try:
-            q_walkin_td = (
-                supabase
-                .table("walkin_table")
-                .select("id", count="exact")
-                .eq("test_drive_done", True)
-            )
-            if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                q_walkin_td = q_walkin_td.gte("updated_at", start_dt_global.isoformat()).lte("updated_at", end_dt_global.isoformat())
-            walkin_td_resp = q_walkin_td.execute()
-            walkin_td_count = int(walkin_td_resp.count or 0)
-        except Exception:
-            walkin_td_count = 0
-
-        # Total test drives
-        total_td_count = ps_td_count + walkin_td_count
-
-        # Calculate previous period for delta
-        prev_total_td_count = 0
-        if prev_start_global is not None and prev_end_global is not None:
-            # Previous period ps_followup_master test drives
-            try:
-                prev_q_ps_td = (
-                    supabase
-                    .table("ps_followup_master")
-                    .select("id", count="exact")
-                    .eq("test_drive_done", True)
-                    .gte("updated_at", prev_start_global.isoformat())
-                    .lte("updated_at", prev_end_global.isoformat())
-                )
-                prev_ps_td_resp = prev_q_ps_td.execute()
-                prev_ps_td_count = int(prev_ps_td_resp.count or 0)
-            except Exception:
-                prev_ps_td_count = 0
-
-            # Previous period walkin_table test drives
-            try:
-                prev_q_walkin_td = (
-                    supabase
-                    .table("walkin_table")
-                    .select("id", count="exact")
-                    .eq("test_drive_done", True)
-                    .gte("updated_at", prev_start_global.isoformat())
-                    .lte("updated_at", prev_end_global.isoformat())
-                )
-                prev_walkin_td_resp = prev_q_walkin_td.execute()
-                prev_walkin_td_count = int(prev_walkin_td_resp.count or 0)
-            except Exception:
-                prev_walkin_td_count = 0
+        # Test drives from ps_followup_master and walkin_table, both filtered on updated_at
+        total_td_count = int(kpis.get("td_ps") or 0) + int(kpis.get("td_walkin") or 0)
 
-            prev_total_td_count = prev_ps_td_count + prev_walkin_td_count
-
-        # Calculate delta
-        if prev_total_td_count == 0:
-            delta_td = "+∞%" if total_td_count > 0 else "0%"
-        else:
-            pct_change_td = (total_td_count - prev_total_td_count) / prev_total_td_count * 100.0
-            delta_td = f"{pct_change_td:+.1f}%"
+        # Previous period (0 when there is no comparison period)
+        prev_total_td_count = int(kpis.get("td_ps_prev") or 0) + int(kpis.get("td_walkin_prev") or 0)
+        delta_td = pct_delta(total_td_count, prev_total_td_count)
 
         st.metric(label="Test Drives Done", value=total_td_count, delta=delta_td)
     except Exception as err:
         st.warning(f"Could not load KPI (Test Drives Done): {err}")
 
-# Horizontal navigation tabs for different dashboard sections
-tab1, tab2, tab3 = st.tabs(["Overall", "Branch Performance", "👥 CRE Performance"])
+# Wide windows are counted from planner estimates (kpis.fetch_kpis); say so under the cards
+if kpis.get("count_mode", "exact") != "exact":
+    st.caption(
+        f"≈ KPI counts: {kpis['count_mode']} (PostgREST planner estimates for large counts). "
+        f"Windows of up to {EXACT_COUNT_MAX_DAYS:g} days are counted exactly."
+    )
+else:
+    st.caption("KPI counts: exact")
+
+def fragment(body):
+    """``st.fragment`` whose standalone reruns are collected as renders of their own (``query_stats.fragment_render``)
+
+    Such a rerun shows its stale-data notice at the top of the fragment; the
+    page's notice keeps describing the last full run.
+    """
+    @st.fragment
+    @functools.wraps(body)
+    def run(*args, **kwargs) -> None:
+        notice = st.empty()
+        with fragment_render() as rerun:
+            body(*args, **kwargs)
+            if rerun:
+                render_stale_notice(notice)
+
+    return run
+
+
+@fragment
+def render_underlying_data(toggle_key: str, title: str, table: str, date_col: str, start, end) -> None:
+    """Toggle showing the raw rows behind a section; flipping it reruns only this panel"""
+    if not st.toggle("view underlying data", value=False, key=toggle_key):
+        return
+    with st.container():
+        st.subheader(title)
+        try:
+            df_underlying = fetch_table_with_progress(
+                f"Loading {table}", table, date_col=date_col, start=start, end=end, normalize=False,
+            )
+
+            st.caption(f"Rows: {len(df_underlying)}")
+            st.dataframe(df_underlying, use_container_width=True, hide_index=False)
+        except Exception as err:
+            st.warning(f"Could not load {table} table: {err}")
 
-with tab1:
-    # Fetch lead sources data with final_status and created_at
+
+def render_overall_tab() -> None:
+    prefetched = run_concurrently(TAB_FETCHES["overall"])
+    # Walkin data shared by the Overall tab (every use checks for an empty frame)
     try:
-        leads_res = supabase.table("lead_master").select("source", "final_status", "created_at").execute()
-        df_leads = pd.DataFrame(leads_res.data)
+        df = unwrap(prefetched, "walkin")
+    except Exception as err:
+        st.warning(f"Could not load walkins: {err}")
+        df = pd.DataFrame()
+
+    # Lead rollup rows for the global window; source chart and ETBR count leads by created_at day
+    try:
+        df_rollup = unwrap(prefetched, "lead_rollup")
     except Exception as err:
         st.warning(f"Could not load lead sources: {err}")
-        df_leads = pd.DataFrame()
+        df_rollup = pd.DataFrame(columns=["basis"])
 
     # Use global date filter inside Admin dashboard
     filter_option_admin = filter_option_global
     start_dt_admin, end_dt_admin = start_dt_global, end_dt_global
 
-    # Apply created_at filter to admin data
-    df_leads_filtered = df_leads.copy()
-    if filter_option_admin != "All time" and start_dt_admin is not None and end_dt_admin is not None:
-        if not df_leads.empty and "created_at" in df_leads.columns:
-            created_ts_admin = pd.to_datetime(df_leads["created_at"], errors="coerce", utc=True)
-            mask_admin = created_ts_admin.between(start_dt_admin, end_dt_admin)
-            df_leads_filtered = df_leads.loc[mask_admin].copy()
-        else:
-            st.warning("created_at column missing; date filter not applied to admin data.")
+    # Per-source Count/Won/TD (created_at days) and Enquiry (PS assigned, ps_assigned_at days),
+    # shared by the source chart and ETBR
+    if not df_rollup.empty:
+        source_summary = sql(
+            """
+            SELECT
+                COALESCE(CAST(source AS VARCHAR), 'Unknown') AS "Source",
+                SUM(leads) FILTER (WHERE basis = 'created_at') AS "Count",
+                SUM(ql) FILTER (WHERE basis = 'ps_assigned_at') AS "Enquiry",
+                SUM(td) FILTER (WHERE basis = 'created_at') AS "TD",
+                SUM(won) FILTER (WHERE basis = 'created_at') AS "Won"
+            FROM rollup
+            GROUP BY 1
+            HAVING SUM(leads) FILTER (WHERE basis = 'created_at') > 0
+            ORDER BY "Count" DESC, "Source"
+            """,
+            rollup=df_rollup,
+        ).fillna(0).astype({"Count": int, "Enquiry": int, "TD": int, "Won": int})
+    else:
+        source_summary = pd.DataFrame(columns=["Source", "Count", "Enquiry", "TD", "Won"])
 
     # Create four columns for Admin dashboard (shrink Conversion a bit, widen Walkin panel)
     left_col, spacer_col, mid_col, right_col = st.columns([0.28, 0.02, 0.26, 0.44])
     
     with left_col:
         st.subheader("Source-wise Lead Count")
-        if not df_leads_filtered.empty and "source" in df_leads_filtered.columns:
-            source_counts = (
-                df_leads_filtered["source"].astype(str).str.strip().replace("", "Unknown").value_counts()
-                .rename_axis("source").reset_index(name="count")
-                .sort_values("count", ascending=False)
-            )
+        if not source_summary.empty:
+            source_counts = source_summary[["Source", "Count"]].rename(columns={"Source": "source", "Count": "count"})
             total_count_admin_chart = int(source_counts["count"].sum()) or 1
             source_counts["percent"] = source_counts["count"] / total_count_admin_chart
             chart = (
@@ -786,30 +506,8 @@ with tab1:
 
     with mid_col:
         st.subheader("ETBR (Overall)")
-        if not df_leads_filtered.empty and "source" in df_leads_filtered.columns:
-            # Clean the filtered data
-            df_leads_clean = df_leads_filtered.copy()
-            df_leads_clean["source"] = df_leads_clean["source"].astype(str).str.strip().replace("", "Unknown")
-            df_leads_clean["final_status"] = df_leads_clean["final_status"].astype(str).str.strip()
-            
-            # Get unique sources and their counts
-            source_counts = df_leads_clean["source"].value_counts()
-            
-            # Calculate won counts for each source
-            won_counts = []
-            for source in source_counts.index:
-                won_count = len(df_leads_clean[
-                    (df_leads_clean["source"] == source) & 
-                    (df_leads_clean["final_status"].str.lower() == "won")
-                ])
-                won_counts.append(won_count)
-            
-            # Create a DataFrame with sources, counts, won counts
-            sources_df = pd.DataFrame({
-                "Source": source_counts.index,
-                "Count": source_counts.values,
-                "Won": won_counts
-            })
+        if not source_summary.empty:
+            sources_df = source_summary.copy()
 
             # Append special Walkin row from walkin_table using same admin filter
             try:
@@ -818,10 +516,9 @@ with tab1:
                     filter_option_admin != "All time"
                     and start_dt_admin is not None
                     and end_dt_admin is not None
-                    and "created_at" in df.columns
+                    and not df.empty
                 ):
-                    created_ts_walkin = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
-                    mask_walkin = created_ts_walkin.between(start_dt_admin, end_dt_admin)
+                    mask_walkin = df["created_at"].between(start_dt_admin, end_dt_admin)
                     df_walkin_admin = df.loc[mask_walkin].copy()
 
                 walkin_total = int(len(df_walkin_admin))
@@ -832,85 +529,33 @@ with tab1:
                     and start_dt_admin is not None
                     and end_dt_admin is not None
                     and not df.empty
-                    and "updated_at" in df.columns
-                    and "status" in df.columns
+                    and has_column("walkin_table", "status")
                 ):
-                    updated_ts_walkin_won = pd.to_datetime(df["updated_at"], errors="coerce", utc=True)
-                    mask_walkin_won = updated_ts_walkin_won.between(start_dt_admin, end_dt_admin)
-                    df_walkin_won_admin = df.loc[mask_walkin_won].copy()
-                    walkin_won = int(
-                        (df_walkin_won_admin["status"].astype(str).str.strip().str.lower() == "won").sum()
-                    )
+                    mask_walkin_won = df["updated_at"].between(start_dt_admin, end_dt_admin)
+                    walkin_won = int((mask_walkin_won & (df["status"] == "won")).sum())
                 else:
-                    # Fallback to created_at filtering if updated_at is not available or "All time" is selected
-                    if "status" in df_walkin_admin.columns:
-                        walkin_won = int(
-                            (df_walkin_admin["status"].astype(str).str.strip().str.lower() == "won").sum()
-                        )
+                    # "All time": won walkins of the whole (created_at-filtered) frame
+                    if not df_walkin_admin.empty and has_column("walkin_table", "status"):
+                        walkin_won = int((df_walkin_admin["status"] == "won").sum())
                     else:
                         walkin_won = 0
 
                 # Compute Walkin TD total consistent with Walkin (branch-wise)
                 td_total_walkin = 0
-                if "test_drive_done" in df_walkin_admin.columns:
-                    tdd_series_mid = df_walkin_admin["test_drive_done"]
-                    if pd.api.types.is_bool_dtype(tdd_series_mid):
-                        td_mask_mid = tdd_series_mid.fillna(False)
-                    else:
-                        td_mask_mid = tdd_series_mid.astype(str).str.strip().str.lower().isin(["true", "yes", "1"])
-                    td_total_walkin = int(td_mask_mid.sum())
+                if not df_walkin_admin.empty and has_column("walkin_table", "test_drive_done"):
+                    td_total_walkin = int(df_walkin_admin["test_drive_done"].sum())
 
                 walkin_row = pd.DataFrame([
-                    {"Source": "Walkin", "Count": walkin_total, "Won": walkin_won}
+                    {"Source": "Walkin", "Count": walkin_total, "Enquiry": walkin_total, "TD": td_total_walkin, "Won": walkin_won}
                 ])
                 sources_df = pd.concat([sources_df, walkin_row], ignore_index=True)
+                # Walkin Enquiry = total punched, TD = TD total from the Walkin table (also for a lead_master "Walkin" source)
+                walkin_src_mask = sources_df["Source"].astype(str).str.strip().str.lower() == "walkin"
+                sources_df.loc[walkin_src_mask, "Enquiry"] = walkin_total
+                sources_df.loc[walkin_src_mask, "TD"] = td_total_walkin
             except Exception as err:
                 st.warning(f"Could not append Walkin row: {err}")
 
-            # Enquiry per source for Conversion table (non-Walkin via lead_master ps_name not null; Walkin = total punched)
-            try:
-                enquiry_map_conv = {}
-                for src in list(sources_df["Source"]):
-                    if str(src).strip().lower() == "walkin":
-                        enquiry_map_conv[src] = int(walkin_total)
-                        continue
-                    q_conv = (
-                        supabase
-                        .table("lead_master")
-                        .select("id", count="exact")
-                        .not_.is_("ps_name", "null")
-                        .eq("source", src)
-                    )
-                    if filter_option_admin != "All time" and start_dt_admin is not None and end_dt_admin is not None:
-                        q_conv = q_conv.gte("ps_assigned_at", start_dt_admin.isoformat()).lte("ps_assigned_at", end_dt_admin.isoformat())
-                    r_conv = q_conv.execute()
-                    enquiry_map_conv[src] = int(r_conv.count or 0)
-                sources_df["Enquiry"] = sources_df["Source"].map(enquiry_map_conv).astype(int)
-            except Exception as err:
-                st.warning(f"Could not compute Enquiry for Conversion: {err}")
-
-            # TD per source for Conversion table (non-Walkin via lead_master test_drive_status; Walkin = TD total from Walkin table)
-            try:
-                td_map_conv = {}
-                for src in list(sources_df["Source"]):
-                    if str(src).strip().lower() == "walkin":
-                        td_map_conv[src] = int(td_total_walkin)
-                        continue
-                    q_td_conv = (
-                        supabase
-                        .table("lead_master")
-                        .select("id", count="exact")
-                        .eq("test_drive_status", True)
-                        .eq("source", src)
-                    )
-                    if filter_option_admin != "All time" and start_dt_admin is not None and end_dt_admin is not None:
-                        q_td_conv = q_td_conv.gte("created_at", start_dt_admin.isoformat()).lte("created_at", end_dt_admin.isoformat())
-                    r_td_conv = q_td_conv.execute()
-                    td_map_conv[src] = int(r_td_conv.count or 0)
-                sources_df["TD"] = sources_df["Source"].map(td_map_conv).astype(int)
-            except Exception as err:
-                st.warning(f"Could not compute TD for Conversion: {err}")
-
             # Calculate conversion percentage (QL/BR * 100) where QL = Enquiry, BR = Won
             if "Enquiry" in sources_df.columns and "Won" in sources_df.columns:
                 sources_df["%"] = sources_df.apply(
@@ -951,115 +596,31 @@ with tab1:
     # Right column: Walkin (branch-wise) using the same Admin date filter
     with right_col:
         st.subheader("Walkin (branch-wise)")
-        # Apply created_at filter to walkin data
-        df_walkin_admin = df.copy()
-        if (
-            filter_option_admin != "All time"
-            and start_dt_admin is not None
-            and end_dt_admin is not None
-            and not df.empty
-            and "created_at" in df.columns
-        ):
-            created_ts_walkin_admin = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
-            mask_walkin_admin = created_ts_walkin_admin.between(start_dt_admin, end_dt_admin)
-            df_walkin_admin = df.loc[mask_walkin_admin].copy()
-
-        # Build summary table
-        if not df_walkin_admin.empty and "branch" in df_walkin_admin.columns:
-            unique_branches_admin = (
-                pd.Series(sorted(df_walkin_admin["branch"].dropna().astype(str).unique()))
-                .rename("branch")
-                .to_frame()
-            )
-            branch_counts_admin = (
-                df_walkin_admin["branch"].astype(str).value_counts().rename_axis("branch").reset_index(name="rows")
+        # One pass over the walkin frame: Punched/Pending/Touched/Untouched/Lost/TD by created_at,
+        # Won by updated_at; branches are those with walkins created in the window
+        bounded_admin = filter_option_admin != "All time" and start_dt_admin is not None and end_dt_admin is not None
+        in_created_walkin = window_predicate("created_at", bounded_admin)
+        if not df.empty:
+            branches_table_admin = sql(
+                f"""
+                SELECT
+                    CAST(branch AS VARCHAR) AS branch,
+                    COUNT(*) FILTER (WHERE {in_created_walkin}) AS rows,
+                    COUNT(*) FILTER (WHERE {in_created_walkin} AND status = 'pending') AS pending,
+                    COUNT(*) FILTER (WHERE {in_created_walkin} AND is_touched) AS touched,
+                    COUNT(*) FILTER (WHERE {in_created_walkin} AND is_untouched) AS untouched,
+                    COUNT(*) FILTER (WHERE {window_predicate("updated_at", bounded_admin)} AND status = 'won') AS won,
+                    COUNT(*) FILTER (WHERE {in_created_walkin} AND status = 'lost') AS lost,
+                    COUNT(*) FILTER (WHERE {in_created_walkin} AND test_drive_done) AS td
+                FROM walkin
+                WHERE branch IS NOT NULL
+                GROUP BY branch
+                HAVING COUNT(*) FILTER (WHERE {in_created_walkin}) > 0
+                ORDER BY CAST(branch AS VARCHAR)
+                """,
+                {"start": start_dt_admin, "end": end_dt_admin} if bounded_admin else None,
+                walkin=df,
             )
-            # Status-based counts
-            if "status" in df_walkin_admin.columns:
-                pending_counts_admin = (
-                    df_walkin_admin[df_walkin_admin["status"].astype(str).str.strip().str.lower() == "pending"]
-                    .groupby("branch").size().rename_axis("branch").reset_index(name="pending")
-                )
-                # Won counts using updated_at filter instead of created_at
-                won_counts_admin = pd.DataFrame({"branch": [], "won": []})
-                if (
-                    filter_option_admin != "All time"
-                    and start_dt_admin is not None
-                    and end_dt_admin is not None
-                    and not df.empty
-                    and "updated_at" in df.columns
-                ):
-                    updated_ts_won = pd.to_datetime(df["updated_at"], errors="coerce", utc=True)
-                    mask_won = updated_ts_won.between(start_dt_admin, end_dt_admin)
-                    df_won_admin = df.loc[mask_won].copy()
-                    won_counts_admin = (
-                        df_won_admin[df_won_admin["status"].astype(str).str.strip().str.lower() == "won"]
-                        .groupby("branch").size().rename_axis("branch").reset_index(name="won")
-                    )
-                else:
-                    # Fallback to created_at filtering if updated_at is not available or "All time" is selected
-                    won_counts_admin = (
-                        df_walkin_admin[df_walkin_admin["status"].astype(str).str.strip().str.lower() == "won"]
-                        .groupby("branch").size().rename_axis("branch").reset_index(name="won")
-                    )
-                lost_counts_admin = (
-                    df_walkin_admin[df_walkin_admin["status"].astype(str).str.strip().str.lower() == "lost"]
-                    .groupby("branch").size().rename_axis("branch").reset_index(name="lost")
-                )
-            else:
-                pending_counts_admin = pd.DataFrame({"branch": [], "pending": []})
-                won_counts_admin = pd.DataFrame({"branch": [], "won": []})
-                lost_counts_admin = pd.DataFrame({"branch": [], "lost": []})
-
-            # Test drive done (TD) counts per branch within filtered data
-            if "test_drive_done" in df_walkin_admin.columns:
-                tdd_series = df_walkin_admin["test_drive_done"]
-                if pd.api.types.is_bool_dtype(tdd_series):
-                    td_mask_admin = tdd_series.fillna(False)
-                else:
-                    td_mask_admin = tdd_series.astype(str).str.strip().str.lower().isin(["true", "yes", "1"])
-                td_counts_admin = (
-                    df_walkin_admin[td_mask_admin]
-                    .groupby("branch")
-                    .size()
-                    .rename_axis("branch")
-                    .reset_index(name="td")
-                )
-            else:
-                td_counts_admin = pd.DataFrame({"branch": [], "td": []})
-
-            # Touched/Untouched among pending
-            if "first_call_date" in df_walkin_admin.columns and "status" in df_walkin_admin.columns:
-                status_pending_mask_admin = df_walkin_admin["status"].astype(str).str.strip().str.lower() == "pending"
-                has_first_call_mask_admin = df_walkin_admin["first_call_date"].notna() & (df_walkin_admin["first_call_date"].astype(str).str.strip() != "")
-                touched_mask_admin = status_pending_mask_admin & has_first_call_mask_admin
-                untouched_mask_admin = status_pending_mask_admin & ~has_first_call_mask_admin
-                touched_counts_admin = (
-                    df_walkin_admin[touched_mask_admin]
-                    .groupby("branch").size().rename_axis("branch").reset_index(name="touched")
-                )
-                untouched_counts_admin = (
-                    df_walkin_admin[untouched_mask_admin]
-                    .groupby("branch").size().rename_axis("branch").reset_index(name="untouched")
-                )
-            else:
-                touched_counts_admin = pd.DataFrame({"branch": [], "touched": []})
-                untouched_counts_admin = pd.DataFrame({"branch": [], "untouched": []})
-
-            branches_table_admin = unique_branches_admin.merge(branch_counts_admin, on="branch", how="left").fillna({"rows": 0})
-            branches_table_admin = branches_table_admin.merge(pending_counts_admin, on="branch", how="left").fillna({"pending": 0})
-            branches_table_admin = branches_table_admin.merge(touched_counts_admin, on="branch", how="left").fillna({"touched": 0})
-            branches_table_admin = branches_table_admin.merge(untouched_counts_admin, on="branch", how="left").fillna({"untouched": 0})
-            branches_table_admin = branches_table_admin.merge(won_counts_admin, on="branch", how="left").fillna({"won": 0})
-            branches_table_admin = branches_table_admin.merge(lost_counts_admin, on="branch", how="left").fillna({"lost": 0})
-            branches_table_admin = branches_table_admin.merge(td_counts_admin, on="branch", how="left").fillna({"td": 0})
-            branches_table_admin["rows"] = branches_table_admin["rows"].astype(int)
-            branches_table_admin["pending"] = branches_table_admin["pending"].astype(int)
-            branches_table_admin["touched"] = branches_table_admin["touched"].astype(int)
-            branches_table_admin["untouched"] = branches_table_admin["untouched"].astype(int)
-            branches_table_admin["won"] = branches_table_admin["won"].astype(int)
-            branches_table_admin["lost"] = branches_table_admin["lost"].astype(int)
-            branches_table_admin["td"] = branches_table_admin["td"].astype(int)
         else:
             branches_table_admin = pd.DataFrame({"branch": [], "rows": [], "pending": [], "touched": [], "untouched": [], "won": [], "lost": [], "td": []})
 
@@ -1100,95 +661,57 @@ with tab1:
     with st.container():
         st.subheader("Digital Leads Summary (branch-wise)")
         try:
-            lm_res = (
-                supabase
-                .table("lead_master")
-                .select("branch", "ps_assigned_at", "ps_name", "source", "final_status")
-                .execute()
-            )
-            df_lm = pd.DataFrame(lm_res.data)
-
-            # Apply global/Overall date filter on created_at
-            df_lm_filtered = df_lm.copy()
-            if filter_option_admin != "All time" and start_dt_admin is not None and end_dt_admin is not None:
-                if not df_lm.empty and "ps_assigned_at" in df_lm.columns:
-                    assigned_ts_lm = pd.to_datetime(df_lm["ps_assigned_at"], errors="coerce", utc=True)
-                    mask_lm = assigned_ts_lm.between(start_dt_admin, end_dt_admin)
-                    df_lm_filtered = df_lm.loc[mask_lm].copy()
-
-            # Build table with unique branch values and Leads Assigned count (ps_name not null)
-            if not df_lm_filtered.empty and "branch" in df_lm_filtered.columns:
-                branch_clean = df_lm_filtered["branch"].fillna("").astype(str).str.strip().replace("", "Unknown")
+            # Leads by ps_assigned_at day, per branch and source: Leads Assigned = PS assigned
+            # over the branch, SRC = PS assigned and SRC(R) = won for each source
+            if not df_rollup.empty:
+                branch_sources = sql(
+                    """
+                    SELECT
+                        "Branch",
+                        "Source",
+                        SUM(ql) AS ql,
+                        SUM(won) AS won,
+                        SUM(SUM(ql)) OVER (PARTITION BY "Branch") AS "Leads Assigned"
+                    FROM (
+                        SELECT
+                            COALESCE(CAST(branch AS VARCHAR), 'Unknown') AS "Branch",
+                            UPPER(CAST(source AS VARCHAR)) AS "Source",
+                            ql,
+                            won
+                        FROM rollup
+                        WHERE basis = 'ps_assigned_at'
+                    )
+                    GROUP BY "Branch", "Source"
+                    ORDER BY "Branch", "Source"
+                    """,
+                    rollup=df_rollup,
+                )
+            else:
+                branch_sources = pd.DataFrame(columns=["Branch", "Source", "ql", "won", "Leads Assigned"])
+            if not branch_sources.empty:
                 branches_unique_df = (
-                    pd.Series(sorted(branch_clean.unique()))
-                    .rename("Branch")
-                    .to_frame()
+                    branch_sources[["Branch", "Leads Assigned"]]
+                    .drop_duplicates("Branch")
+                    .astype({"Leads Assigned": int})
+                    .reset_index(drop=True)
                 )
-
-                # Count rows per branch where ps_name exists (not null/empty)
-                if "ps_name" in df_lm_filtered.columns:
-                    ps_exists = df_lm_filtered["ps_name"].notna() & (df_lm_filtered["ps_name"].astype(str).str.strip() != "")
-                    assigned_counts = (
-                        branch_clean[ps_exists]
-                        .value_counts()
-                        .rename_axis("Branch")
-                        .reset_index(name="Leads Assigned")
-                    )
-                    branches_unique_df = (
-                        branches_unique_df
-                        .merge(assigned_counts, on="Branch", how="left")
-                        .fillna({"Leads Assigned": 0})
+                by_source = branch_sources.dropna(subset=["Source"])
+                source_names = sorted(by_source["Source"].unique())
+                if source_names:
+                    # Dynamic source columns: SRC followed by SRC(R), zero where a branch has none
+                    source_cols = (
+                        by_source.pivot(index="Branch", columns="Source", values=["ql", "won"])
+                        .fillna(0)
+                        .astype(int)
                     )
-                    branches_unique_df["Leads Assigned"] = branches_unique_df["Leads Assigned"].astype(int)
-
-                    # Dynamic source columns (Assigned): ps_name exists AND source == value (per branch)
-                    if "source" in df_lm_filtered.columns:
-                        source_clean_upper_assigned = df_lm_filtered["source"].fillna("").astype(str).str.strip().str.upper()
-                        unique_sources_assigned = sorted(source_clean_upper_assigned[source_clean_upper_assigned != ""].unique().tolist())
-                        for src in unique_sources_assigned:
-                            src_mask_assigned = source_clean_upper_assigned == src
-                            src_counts_assigned = (
-                                branch_clean[ps_exists & src_mask_assigned]
-                                .value_counts()
-                                .rename_axis("Branch")
-                                .reset_index(name=src)
-                            )
-                            branches_unique_df = (
-                                branches_unique_df
-                                .merge(src_counts_assigned, on="Branch", how="left")
-                                .fillna({src: 0})
-                            )
-                            branches_unique_df[src] = branches_unique_df[src].astype(int)
-
-                # Dynamic source columns: for each unique source value, count rows where
-                # source == that value AND final_status == "Won" (per branch)
-                if "source" in df_lm_filtered.columns:
-                    source_clean_upper = df_lm_filtered["source"].fillna("").astype(str).str.strip().str.upper()
-                    final_status_clean = df_lm_filtered.get("final_status", pd.Series(dtype=object)).fillna("").astype(str).str.strip().str.lower()
-                    unique_sources = sorted(source_clean_upper[source_clean_upper != ""].unique().tolist())
-                    for src in unique_sources:
-                        src_mask = source_clean_upper == src
-                        retailed_mask = src_mask & (final_status_clean == "won")
-                        src_counts = (
-                            branch_clean[retailed_mask]
-                            .value_counts()
-                            .rename_axis("Branch")
-                            .reset_index(name=f"{src}(R)")
-                        )
-                        branches_unique_df = (
-                            branches_unique_df
-                            .merge(src_counts, on="Branch", how="left")
-                            .fillna({f"{src}(R)": 0})
-                        )
-                        branches_unique_df[f"{src}(R)"] = branches_unique_df[f"{src}(R)"].astype(int)
+                    source_cols.columns = [src if kind == "ql" else f"{src}(R)" for kind, src in source_cols.columns]
+                    source_cols = source_cols[[c for src in source_names for c in (src, f"{src}(R)")]]
+                    branches_unique_df = branches_unique_df.merge(source_cols, left_on="Branch", right_index=True, how="left")
+                    branches_unique_df[source_cols.columns] = branches_unique_df[source_cols.columns].fillna(0).astype(int)
 
                 # Create percentage columns per source: {SRC}(%) = {SRC}(R) / {SRC} * 100
                 try:
-                    src_list_for_pct = (
-                        df_lm_filtered["source"].fillna("").astype(str).str.strip().str.upper()
-                    )
-                    src_list_for_pct = sorted([s for s in src_list_for_pct.unique().tolist() if s != ""])
-                    for src in src_list_for_pct:
+                    for src in source_names:
                         base_col = src
                         retailed_col = f"{src}(R)"
                         pct_col = f"{src}(%)"
@@ -1201,16 +724,123 @@ with tab1:
                 except Exception:
                     pass
 
+                # Compute PS Untouched per branch (from ps_followup_master) using global Admin date filter
+                try:
+                    df_ps_overall = unwrap(prefetched, "ps_overall")
+                    if not df_ps_overall.empty:
+                        # Already restricted to the global ps_assigned_at window server-side
+                        # Clean branch names to align with branches_unique_df
+                        branch_clean_ps = fill_label(df_ps_overall.get("ps_branch", pd.Series(dtype=object)), "Unknown")
+
+                        df_untouched_ps = (
+                            branch_clean_ps[df_ps_overall["is_untouched"]]
+                            .value_counts()
+                            .rename_axis("Branch")
+                            .reset_index(name="Untouched")
+                        )
+
+                        # Merge into branches summary table
+                        branches_unique_df = (
+                            branches_unique_df
+                            .merge(df_untouched_ps, on="Branch", how="left")
+                            .fillna({"Untouched": 0})
+                        )
+                        branches_unique_df["Untouched"] = branches_unique_df["Untouched"].astype(int)
+
+                        # Open Leads / Won / Lost per branch: count per PS across walkin_table,
+                        # ps_followup_master and activity_leads, then sum over each branch's PS
+                        # Build mapping Branch -> PS (a PS can appear under several branches)
+                        branch_to_ps_df = pd.DataFrame({
+                            "Branch": branch_clean_ps,
+                            "PS": df_ps_overall.get("ps_name", pd.Series(dtype=object)),
+                        }).dropna(subset=["PS"])
+                        branch_to_ps_df = branch_to_ps_df[
+                            branch_to_ps_df["PS"].str.lower() != "unassigned ps"
+                        ].drop_duplicates()
+
+                        has_window_ps = filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None
+                        per_ps_frames = []
+
+                        # walkin_table: Pending (all time) from the Pending-only fetch, Won/Lost on
+                        # updated_at from the windowed walkin frame already loaded
+                        try:
+                            df_walkin_open = unwrap(prefetched, "walkin_open")
+                            if not df_walkin_open.empty:
+                                per_ps_frames.append(pd.DataFrame({
+                                    "PS": df_walkin_open["ps_assigned"],
+                                    "Open Leads": 1,
+                                    "Won": 0,
+                                    "Lost": 0,
+                                }))
+                        except Exception:
+                            pass
+                        try:
+                            if not df.empty and has_column("walkin_table", "ps_assigned") and has_column("walkin_table", "status"):
+                                status_w = df["status"]
+                                if has_window_ps:
+                                    window_w = df["updated_at"].between(start_dt_global, end_dt_global)
+                                else:
+                                    window_w = pd.Series(True, index=df.index)
+                                per_ps_frames.append(pd.DataFrame({
+                                    "PS": df["ps_assigned"],
+                                    "Open Leads": 0,
+                                    "Won": ((status_w == "won") & window_w).astype(int),
+                                    "Lost": ((status_w == "lost") & window_w).astype(int),
+                                }))
+                        except Exception:
+                            pass
+
+                        # ps_followup_master and activity_leads: Pending with a first call (all time;
+                        # the fetch already keeps only Pending rows), Won/Lost within the window
+                        for src_key in ("pfm", "act"):
+                            try:
+                                df_open_src = unwrap(prefetched, f"{src_key}_open")
+                                if not df_open_src.empty:
+                                    per_ps_frames.append(pd.DataFrame({
+                                        "PS": df_open_src["ps_name"],
+                                        "Open Leads": df_open_src["has_first_call"].astype(int),
+                                        "Won": 0,
+                                        "Lost": 0,
+                                    }))
+                            except Exception:
+                                pass
+                            try:
+                                df_closed_src = unwrap(prefetched, f"{src_key}_closed")
+                                if not df_closed_src.empty:
+                                    per_ps_frames.append(pd.DataFrame({
+                                        "PS": df_closed_src["ps_name"],
+                                        "Open Leads": 0,
+                                        "Won": (df_closed_src["final_status"] == "won").astype(int),
+                                        "Lost": (df_closed_src["final_status"] == "lost").astype(int),
+                                    }))
+                            except Exception:
+                                pass
+
+                        if per_ps_frames:
+                            per_ps_counts = pd.concat(per_ps_frames, ignore_index=True).groupby("PS", observed=True)[["Open Leads", "Won", "Lost"]].sum()
+                        else:
+                            per_ps_counts = pd.DataFrame(columns=["Open Leads", "Won", "Lost"])
+                        branch_counts_ps = (
+                            branch_to_ps_df
+                            .merge(per_ps_counts, left_on="PS", right_index=True, how="left")
+                            .groupby("Branch", observed=True)[["Open Leads", "Won", "Lost"]]
+                            .sum()
+                            .reset_index()
+                        )
+
+                        branches_unique_df = branches_unique_df.merge(branch_counts_ps, on="Branch", how="left")
+                        branches_unique_df["Open Leads"] = branches_unique_df["Open Leads"].fillna(0).astype(int)
+                        branches_unique_df["Won"] = branches_unique_df["Won"].fillna(0).astype(int)
+                        branches_unique_df["Lost"] = branches_unique_df["Lost"].fillna(0).astype(int)
+                except Exception:
+                    pass
+
                 # Reorder columns so each source is followed by its (R) and (%) columns,
                 # and sort source groups by total base counts descending
                 try:
-                    src_candidates_series = (
-                        df_lm_filtered["source"].fillna("").astype(str).str.strip().str.upper()
-                    )
-                    src_candidates = [s for s in src_candidates_series.unique().tolist() if s != ""]
                     # Sort by total counts in base columns (descending)
                     reorder_sources = sorted(
-                        src_candidates,
+                        source_names,
                         key=lambda s: (int(branches_unique_df[s].sum()) if s in branches_unique_df.columns else 0),
                         reverse=True,
                     )
@@ -1258,10 +888,6 @@ with tab1:
                 display_lb = branches_unique_df.set_index("Branch")
                 # Style: faintly color groups of columns per source (SRC, SRC(R), SRC(%))
                 try:
-                    source_names_for_style = (
-                        df_lm_filtered["source"].fillna("").astype(str).str.strip().str.upper()
-                    )
-                    source_names_for_style = [s for s in sorted(source_names_for_style.unique().tolist()) if s != ""]
                     palette = [
                         "rgba(65,157,120,0.08)",   # green
                         "rgba(59,130,246,0.08)",   # blue
@@ -1272,7 +898,7 @@ with tab1:
                         "rgba(107,114,128,0.08)",  # gray
                     ]
                     col_to_color = {}
-                    for idx, src in enumerate(source_names_for_style):
+                    for idx, src in enumerate(source_names):
                         group_cols = [src, f"{src}(R)", f"{src}(%)"]
                         existing_cols = [c for c in group_cols if c in display_lb.columns]
                         if existing_cols:
@@ -1294,381 +920,6 @@ with tab1:
                     st.dataframe(styled_dl, use_container_width=True, hide_index=False)
                 except Exception:
                     st.dataframe(display_lb, use_container_width=True, hide_index=False)
-
-                # Compute PS Untouched per branch (from ps_followup_master) using global Admin date filter
-                try:
-                    ps_overall_res = (
-                        supabase
-                        .table("ps_followup_master")
-                        .select("ps_branch", "ps_assigned_at", "final_status", "lead_status", "first_call_date", "ps_name")
-                        .execute()
-                    )
-                    df_ps_overall = pd.DataFrame(ps_overall_res.data)
-                    if not df_ps_overall.empty:
-                        # Apply admin/global date filter on ps_assigned_at
-                        if (
-                            filter_option_admin != "All time"
-                            and start_dt_admin is not None
-                            and end_dt_admin is not None
-                            and "ps_assigned_at" in df_ps_overall.columns
-                        ):
-                            ts_ps_all = pd.to_datetime(df_ps_overall["ps_assigned_at"], errors="coerce", utc=True)
-                            mask_ps_all = ts_ps_all.between(start_dt_admin, end_dt_admin)
-                            df_ps_overall = df_ps_overall.loc[mask_ps_all].copy()
-
-                        # Clean branch names to align with branches_unique_df
-                        branch_clean_ps = (
-                            df_ps_overall.get("ps_branch", pd.Series(dtype=object))
-                            .fillna("")
-                            .astype(str)
-                            .str.strip()
-                            .replace("", "Unknown")
-                        )
-
-                        # Untouched mask per PS logic
-                        lead_status_ps = df_ps_overall.get("lead_status", pd.Series(dtype=object))
-                        final_status_ps = df_ps_overall.get("final_status", pd.Series(dtype=object))
-                        first_call_ps = df_ps_overall.get("first_call_date", pd.Series(dtype=object))
-
-                        exclude_statuses = [
-                            'Lost to Codealer', 'Lost to Competition', 'Dropped', 'Booked', 'Retailed',
-                            'Call me Back', 'RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected'
-                        ]
-                        untouched_mask_ps = (
-                            (final_status_ps.fillna("Pending").astype(str).str.strip().str.lower().isin(["pending"]))
-                            | (final_status_ps.isna())
-                        ) & (first_call_ps.isna()) & (
-                            lead_status_ps.isna() | (~lead_status_ps.astype(str).isin(exclude_statuses))
-                        )
-
-                        df_untouched_ps = (
-                            branch_clean_ps[untouched_mask_ps]
-                            .value_counts()
-                            .rename_axis("Branch")
-                            .reset_index(name="Untouched")
-                        )
-
-                        # Merge into branches summary table
-                        branches_unique_df = (
-                            branches_unique_df
-                            .merge(df_untouched_ps, on="Branch", how="left")
-                            .fillna({"Untouched": 0})
-                        )
-                        branches_unique_df["Untouched"] = branches_unique_df["Untouched"].astype(int)
-
-                        # Compute Open Leads per branch by summing PS-level open leads logic
-                        # Build mapping Branch -> PS list
-                        branch_to_ps_df = pd.DataFrame({
-                            "Branch": branch_clean_ps,
-                            "PS": df_ps_overall.get("ps_name", pd.Series(dtype=object)).astype(str)
-                        })
-                        unique_branches_list = branches_unique_df["Branch"].tolist()
-                        open_leads_values = []
-                        won_values = []
-                        lost_values = []
-                        for br in unique_branches_list:
-                            try:
-                                ps_list = (
-                                    branch_to_ps_df[branch_to_ps_df["Branch"].fillna("").astype(str).str.strip().replace("", "Unknown") == br]["PS"]
-                                    .dropna()
-                                    .astype(str)
-                                    .str.strip()
-                                    .tolist()
-                                )
-                                ps_list = [p for p in ps_list if p and p.lower() != "unassigned ps"]
-                                total_open = 0
-                                total_won = 0
-                                if ps_list:
-                                    # walkin_table Pending by ps_assigned in ps_list
-                                    try:
-                                        q_w = (
-                                            supabase
-                                            .table("walkin_table")
-                                            .select("id", count="exact")
-                                            .eq("status", "Pending")
-                                        )
-                                        try:
-                                            r_w = q_w.in_("ps_assigned", ps_list).execute()
-                                            total_open += int(r_w.count or 0)
-                                        except Exception:
-                                            subtotal = 0
-                                            for psn in ps_list:
-                                                r_wl = q_w.eq("ps_assigned", psn).execute()
-                                                subtotal += int(r_wl.count or 0)
-                                                q_w = (
-                                                    supabase
-                                                    .table("walkin_table")
-                                                    .select("id", count="exact")
-                                                    .eq("status", "Pending")
-                                                )
-                                            total_open += subtotal
-                                    except Exception:
-                                        pass
-
-                                    # ps_followup_master Pending with first_call_date not null
-                                    try:
-                                        q_p = (
-                                            supabase
-                                            .table("ps_followup_master")
-                                            .select("id", count="exact")
-                                            .eq("final_status", "Pending")
-                                            .not_.is_("first_call_date", "null")
-                                        )
-                                        try:
-                                            r_p = q_p.in_("ps_name", ps_list).execute()
-                                            total_open += int(r_p.count or 0)
-                                        except Exception:
-                                            subtotal = 0
-                                            for psn in ps_list:
-                                                r_pl = q_p.eq("ps_name", psn).execute()
-                                                subtotal += int(r_pl.count or 0)
-                                                q_p = (
-                                                    supabase
-                                                    .table("ps_followup_master")
-                                                    .select("id", count="exact")
-                                                    .eq("final_status", "Pending")
-                                                    .not_.is_("first_call_date", "null")
-                                                )
-                                            total_open += subtotal
-                                    except Exception:
-                                        pass
-
-                                    # activity_leads Pending with ps_first_call_date not null
-                                    try:
-                                        q_a = (
-                                            supabase
-                                            .table("activity_leads")
-                                            .select("id", count="exact")
-                                            .eq("final_status", "Pending")
-                                            .not_.is_("ps_first_call_date", "null")
-                                        )
-                                        try:
-                                            r_a = q_a.in_("ps_name", ps_list).execute()
-                                            total_open += int(r_a.count or 0)
-                                        except Exception:
-                                            subtotal = 0
-                                            for psn in ps_list:
-                                                r_al = q_a.eq("ps_name", psn).execute()
-                                                subtotal += int(r_al.count or 0)
-                                                q_a = (
-                                                    supabase
-                                                    .table("activity_leads")
-                                                    .select("id", count="exact")
-                                                    .eq("final_status", "Pending")
-                                                    .not_.is_("ps_first_call_date", "null")
-                                                )
-                                            total_open += subtotal
-                                    except Exception:
-                                        pass
-
-                                    # Won across three sources for PS list
-                                    # walkin_table Won
-                                    try:
-                                        q_ww = (
-                                            supabase
-                                            .table("walkin_table")
-                                            .select("id", count="exact")
-                                            .eq("status", "Won")
-                                        )
-                                        # Apply date filter for non-"All time" using updated_at
-                                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                            q_ww = q_ww.gte("updated_at", start_dt_ps.isoformat()).lte("updated_at", end_dt_ps.isoformat())
-                                        try:
-                                            r_ww = q_ww.in_("ps_assigned", ps_list).execute()
-                                            total_won += int(r_ww.count or 0)
-                                        except Exception:
-                                            subtotal = 0
-                                            for psn in ps_list:
-                                                q_ww_each = q_ww.eq("ps_assigned", psn)
-                                                r_wwl = q_ww_each.execute()
-                                                subtotal += int(r_wwl.count or 0)
-                                                q_ww = (
-                                                    supabase
-                                                    .table("walkin_table")
-                                                    .select("id", count="exact")
-                                                    .eq("status", "Won")
-                                                )
-                                                if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                                    q_ww = q_ww.gte("updated_at", start_dt_ps.isoformat()).lte("updated_at", end_dt_ps.isoformat())
-                                            total_won += subtotal
-                                    except Exception:
-                                        pass
-
-                                    # ps_followup_master Won
-                                    try:
-                                        q_pw = (
-                                            supabase
-                                            .table("ps_followup_master")
-                                            .select("id", count="exact")
-                                            .eq("final_status", "Won")
-                                        )
-                                        # Apply date filter for non-"All time" using won_timestamp
-                                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                            q_pw = q_pw.gte("won_timestamp", start_dt_ps.isoformat()).lte("won_timestamp", end_dt_ps.isoformat())
-                                        try:
-                                            r_pw = q_pw.in_("ps_name", ps_list).execute()
-                                            total_won += int(r_pw.count or 0)
-                                        except Exception:
-                                            subtotal = 0
-                                            for psn in ps_list:
-                                                q_pw_each = q_pw.eq("ps_name", psn)
-                                                r_pwl = q_pw_each.execute()
-                                                subtotal += int(r_pwl.count or 0)
-                                                q_pw = (
-                                                    supabase
-                                                    .table("ps_followup_master")
-                                                    .select("id", count="exact")
-                                                    .eq("final_status", "Won")
-                                                )
-                                                if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                                    q_pw = q_pw.gte("won_timestamp", start_dt_ps.isoformat()).lte("won_timestamp", end_dt_ps.isoformat())
-                                            total_won += subtotal
-                                    except Exception:
-                                        pass
-
-                                    # activity_leads Won
-                                    try:
-                                        q_aw = (
-                                            supabase
-                                            .table("activity_leads")
-                                            .select("id", count="exact")
-                                            .eq("final_status", "Won")
-                                        )
-                                        # Apply date filter for non-"All time" using created_at
-                                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                            q_aw = q_aw.gte("created_at", start_dt_ps.isoformat()).lte("created_at", end_dt_ps.isoformat())
-                                        try:
-                                            r_aw = q_aw.in_("ps_name", ps_list).execute()
-                                            total_won += int(r_aw.count or 0)
-                                        except Exception:
-                                            subtotal = 0
-                                            for psn in ps_list:
-                                                q_aw_each = q_aw.eq("ps_name", psn)
-                                                r_awl = q_aw_each.execute()
-                                                subtotal += int(r_awl.count or 0)
-                                                q_aw = (
-                                                    supabase
-                                                    .table("activity_leads")
-                                                    .select("id", count="exact")
-                                                    .eq("final_status", "Won")
-                                                )
-                                                if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                                    q_aw = q_aw.gte("created_at", start_dt_ps.isoformat()).lte("created_at", end_dt_ps.isoformat())
-                                            total_won += subtotal
-                                    except Exception:
-                                        pass
-
-                                    # Lost across three sources for PS list
-                                    # walkin_table Lost
-                                    try:
-                                        q_wl = (
-                                            supabase
-                                            .table("walkin_table")
-                                            .select("id", count="exact")
-                                            .eq("status", "Lost")
-                                        )
-                                        # Apply date filter for non-"All time" using updated_at
-                                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                            q_wl = q_wl.gte("updated_at", start_dt_ps.isoformat()).lte("updated_at", end_dt_ps.isoformat())
-                                        try:
-                                            r_wl_many = q_wl.in_("ps_assigned", ps_list).execute()
-                                            lost_branch = int(r_wl_many.count or 0)
-                                        except Exception:
-                                            lost_branch = 0
-                                            for psn in ps_list:
-                                                q_wl_each = q_wl.eq("ps_assigned", psn)
-                                                r_wll = q_wl_each.execute()
-                                                lost_branch += int(r_wll.count or 0)
-                                                q_wl = (
-                                                    supabase
-                                                    .table("walkin_table")
-                                                    .select("id", count="exact")
-                                                    .eq("status", "Lost")
-                                                )
-                                                if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                                    q_wl = q_wl.gte("updated_at", start_dt_ps.isoformat()).lte("updated_at", end_dt_ps.isoformat())
-                                    except Exception:
-                                        lost_branch = 0
-
-                                    # ps_followup_master Lost
-                                    try:
-                                        q_pl = (
-                                            supabase
-                                            .table("ps_followup_master")
-                                            .select("id", count="exact")
-                                            .eq("final_status", "Lost")
-                                        )
-                                        # Apply date filter for non-"All time" using won_timestamp (as requested)
-                                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                            q_pl = q_pl.gte("won_timestamp", start_dt_ps.isoformat()).lte("won_timestamp", end_dt_ps.isoformat())
-                                        try:
-                                            r_pl_many = q_pl.in_("ps_name", ps_list).execute()
-                                            lost_branch += int(r_pl_many.count or 0)
-                                        except Exception:
-                                            for psn in ps_list:
-                                                q_pl_each = q_pl.eq("ps_name", psn)
-                                                r_pll = q_pl_each.execute()
-                                                lost_branch += int(r_pll.count or 0)
-                                                q_pl = (
-                                                    supabase
-                                                    .table("ps_followup_master")
-                                                    .select("id", count="exact")
-                                                    .eq("final_status", "Lost")
-                                                )
-                                                if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                                    q_pl = q_pl.gte("won_timestamp", start_dt_ps.isoformat()).lte("won_timestamp", end_dt_ps.isoformat())
-                                    except Exception:
-                                        pass
-
-                                    # activity_leads Lost
-                                    try:
-                                        q_al = (
-                                            supabase
-                                            .table("activity_leads")
-                                            .select("id", count="exact")
-                                            .eq("final_status", "Lost")
-                                        )
-                                        # Apply date filter for non-"All time" using created_at
-                                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                            q_al = q_al.gte("created_at", start_dt_ps.isoformat()).lte("created_at", end_dt_ps.isoformat())
-                                        try:
-                                            r_al_many = q_al.in_("ps_name", ps_list).execute()
-                                            lost_branch += int(r_al_many.count or 0)
-                                        except Exception:
-                                            for psn in ps_list:
-                                                q_al_each = q_al.eq("ps_name", psn)
-                                                r_all = q_al_each.execute()
-                                                lost_branch += int(r_all.count or 0)
-                                                q_al = (
-                                                    supabase
-                                                    .table("activity_leads")
-                                                    .select("id", count="exact")
-                                                    .eq("final_status", "Lost")
-                                                )
-                                                if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                                                    q_al = q_al.gte("created_at", start_dt_ps.isoformat()).lte("created_at", end_dt_ps.isoformat())
-                                    except Exception:
-                                        pass
-                                else:
-                                    lost_branch = 0
-                                open_leads_values.append(int(total_open))
-                                won_values.append(int(total_won))
-                                lost_values.append(int(lost_branch))
-                            except Exception:
-                                open_leads_values.append(0)
-                                won_values.append(0)
-                                lost_values.append(0)
-
-                        branches_unique_df = branches_unique_df.merge(
-                            pd.DataFrame({"Branch": unique_branches_list, "Open Leads": open_leads_values, "Won": won_values, "Lost": lost_values}),
-                            on="Branch",
-                            how="left",
-                        )
-                        branches_unique_df["Open Leads"] = branches_unique_df["Open Leads"].fillna(0).astype(int)
-                        branches_unique_df["Won"] = branches_unique_df["Won"].fillna(0).astype(int)
-                        branches_unique_df["Lost"] = branches_unique_df["Lost"].fillna(0).astype(int)
-                except Exception:
-                    pass
             else:
                 st.info("No branch data available for the selected range.")
         except Exception as err:
@@ -1676,32 +927,22 @@ with tab1:
 
     # (PS Performance moved to the PS Performance tab)
 
-with tab2:
+
+# The PS section is a fragment: changing its branch filter reruns only the PS tables
+@fragment
+def render_branch_tab() -> None:
+    prefetched = run_concurrently(TAB_FETCHES["branch"])
     # PS Performance (standalone tab), date filter based on ps_assigned_at
     try:
-        ps_res = (
-            supabase
-            .table("ps_followup_master")
-            .select("ps_name", "ps_branch", "ps_assigned_at")
-            .execute()
-        )
-        df_ps = pd.DataFrame(ps_res.data)
-
-        # Use global date filter values; apply on ps_assigned_at
-        filter_option_ps = filter_option_global
+        # Global date window; the fetch is already restricted to the ps_assigned_at window
         start_dt_ps, end_dt_ps = start_dt_global, end_dt_global
 
-        df_ps_filtered = df_ps.copy()
-        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-            if not df_ps.empty and "ps_assigned_at" in df_ps.columns:
-                ps_assigned_ts = pd.to_datetime(df_ps["ps_assigned_at"], errors="coerce", utc=True)
-                mask_ps = ps_assigned_ts.between(start_dt_ps, end_dt_ps)
-                df_ps_filtered = df_ps.loc[mask_ps].copy()
+        df_ps_filtered = unwrap(prefetched, "ps_assignments")
 
         # Branch filter dropdown (from filtered data) in header
-        if not df_ps_filtered.empty and "ps_branch" in df_ps_filtered.columns:
+        if not df_ps_filtered.empty:
             branches = (
-                pd.Series(sorted(df_ps_filtered["ps_branch"].fillna("").astype(str).str.strip().replace("", "Unknown").unique()))
+                pd.Series(sorted(fill_label(df_ps_filtered["ps_branch"], "Unknown").unique()))
                 .tolist()
             )
         else:
@@ -1719,205 +960,51 @@ with tab2:
         # Apply branch selection
         df_ps_branch = df_ps_filtered.copy()
         if selected_branch != "All":
-            df_ps_branch = df_ps_branch[df_ps_branch["ps_branch"].fillna("").astype(str).str.strip().replace("", "Unknown") == selected_branch]
+            df_ps_branch = df_ps_branch[fill_label(df_ps_branch["ps_branch"], "Unknown") == selected_branch]
 
         # Build PS table: PS, Assigned, Untouched, and Pending counts
-        if not df_ps_branch.empty and "ps_name" in df_ps_branch.columns:
-            ps_series = df_ps_branch["ps_name"].fillna("").astype(str).str.strip().replace("", "Unassigned PS")
+        if not df_ps_branch.empty:
+            ps_series = fill_label(df_ps_branch["ps_name"], "Unassigned PS")
             assigned_df = (
-                ps_series.value_counts().rename_axis("PS").reset_index(name="Assigned")
+                ps_series.value_counts().loc[lambda counts: counts > 0]
+                .rename_axis("PS").reset_index(name="Assigned")
+                .astype({"PS": str})
             )
             
-            # Calculate untouched leads and other metrics for each PS
-            untouched_counts = []
-            hot_counts = []
-            warm_counts = []
-            cold_counts = []
-            pending_counts = []
-            won_counts = []
-            lost_counts = []
-            for ps_name in assigned_df["PS"]:
-                if ps_name == "Unassigned PS":
-                    untouched_counts.append(0)
-                    hot_counts.append(0)
-                    warm_counts.append(0)
-                    cold_counts.append(0)
-                    pending_counts.append(0)
-                    won_counts.append(0)
-                    lost_counts.append(0)
-                    continue
-                
-                try:
-                    # Query untouched leads for this PS from ps_followup_master
-                    untouched_query = (
-                        supabase
-                        .table("ps_followup_master")
-                        .select("lead_uid", "final_status", "lead_status", "first_call_date")
-                        .eq("ps_name", ps_name)
-                    )
-                    
-                    # Apply date filter if not "All time"
-                    if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                        untouched_query = untouched_query.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                    
-                    untouched_res = untouched_query.execute()
-                    untouched_data = pd.DataFrame(untouched_res.data)
-                    
-                    if not untouched_data.empty:
-                        # Filter for untouched leads
-                        untouched_mask = (
-                            (untouched_data["final_status"] == "Pending") | 
-                            (untouched_data["final_status"].isna())
-                        ) & (
-                            untouched_data["first_call_date"].isna()
-                        ) & (
-                            (untouched_data["lead_status"].isna()) | 
-                            (~untouched_data["lead_status"].isin([
-                                'Lost to Codealer', 'Lost to Competition', 'Dropped', 'Booked', 'Retailed',
-                                'Call me Back', 'RNR', 'Busy on another Call', 'Call Disconnected', 'Call not Connected'
-                            ]))
-                        )
-                        untouched_count = int(untouched_mask.sum())
+            # Untouched, Hot/Warm/Cold, Open, Won and Lost for every PS from one projected
+            # ps_followup_master fetch (ps_assigned_at window), aggregated with a single groupby
+            ps_metric_cols = ["Untouched", "Hot", "Warm", "Cold", "Open leads", "Won", "Lost"]
+            try:
+                df_pfm = unwrap(prefetched, "ps_followup_window")
+                if not df_pfm.empty:
+                    final_status_pfm = df_pfm.get("final_status", pd.Series(None, index=df_pfm.index, dtype=object))
+                    category_pfm = df_pfm.get("lead_category", pd.Series(None, index=df_pfm.index, dtype=object))
+                    pending_mask_pfm = final_status_pfm == "pending"
+                    # Hot/Warm/Cold honour the branch selection; the other columns do not
+                    if selected_branch != "All":
+                        branch_mask_pfm = df_pfm.get("ps_branch", pd.Series(None, index=df_pfm.index, dtype=object)) == selected_branch
                     else:
-                        untouched_count = 0
-
-                    # Compute Hot leads for this PS
-                    hot_total = 0
-                    try:
-                        hot_query = (
-                            supabase
-                            .table("ps_followup_master")
-                            .select("id", count="exact")
-                            .eq("ps_name", ps_name)
-                            .eq("final_status", "Pending")
-                            .eq("lead_category", "Hot")
-                        )
-                        if selected_branch != "All":
-                            hot_query = hot_query.eq("ps_branch", selected_branch)
-                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                            hot_query = hot_query.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                        r_hot = hot_query.execute()
-                        hot_total = int(r_hot.count or 0)
-                    except Exception:
-                        hot_total = 0
-                    
-                    # Compute Warm leads for this PS
-                    warm_total = 0
-                    try:
-                        warm_query = (
-                            supabase
-                            .table("ps_followup_master")
-                            .select("id", count="exact")
-                            .eq("ps_name", ps_name)
-                            .eq("final_status", "Pending")
-                            .eq("lead_category", "Warm")
-                        )
-                        if selected_branch != "All":
-                            warm_query = warm_query.eq("ps_branch", selected_branch)
-                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                            warm_query = warm_query.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                        r_warm = warm_query.execute()
-                        warm_total = int(r_warm.count or 0)
-                    except Exception:
-                        warm_total = 0
-
-                    # Compute Cold leads for this PS
-                    cold_total = 0
-                    try:
-                        cold_query = (
-                            supabase
-                            .table("ps_followup_master")
-                            .select("id", count="exact")
-                            .eq("ps_name", ps_name)
-                            .eq("final_status", "Pending")
-                            .eq("lead_category", "Cold")
-                        )
-                        if selected_branch != "All":
-                            cold_query = cold_query.eq("ps_branch", selected_branch)
-                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                            cold_query = cold_query.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                        r_cold = cold_query.execute()
-                        cold_total = int(r_cold.count or 0)
-                    except Exception:
-                        cold_total = 0
-
-                    # Compute Pending leads from ps_followup_master for this PS
-                    pending_total = 0
-                    try:
-                        pending_query = (
-                            supabase
-                            .table("ps_followup_master")
-                            .select("id", count="exact")
-                            .eq("ps_name", ps_name)
-                            .eq("final_status", "Pending")
-                        )
-                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                            pending_query = pending_query.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                        r_pending = pending_query.execute()
-                        pending_total = int(r_pending.count or 0)
-                    except Exception:
-                        pending_total = 0
-
-                    # Compute Won leads from ps_followup_master for this PS
-                    won_total = 0
-                    try:
-                        won_query = (
-                            supabase
-                            .table("ps_followup_master")
-                            .select("id", count="exact")
-                            .eq("ps_name", ps_name)
-                            .eq("final_status", "Won")
-                        )
-                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                            won_query = won_query.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                        r_won = won_query.execute()
-                        won_total = int(r_won.count or 0)
-                    except Exception:
-                        won_total = 0
-
-                    # Compute Lost leads from ps_followup_master for this PS
-                    lost_total = 0
-                    try:
-                        lost_query = (
-                            supabase
-                            .table("ps_followup_master")
-                            .select("id", count="exact")
-                            .eq("ps_name", ps_name)
-                            .eq("final_status", "Lost")
-                        )
-                        if filter_option_ps != "All time" and start_dt_ps is not None and end_dt_ps is not None:
-                            lost_query = lost_query.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                        r_lost = lost_query.execute()
-                        lost_total = int(r_lost.count or 0)
-                    except Exception:
-                        lost_total = 0
-                    # We no longer compute Open Leads, Won, or Lost for PS Performance
-                    
-                except Exception as e:
-                    st.write(f"Error calculating untouched for {ps_name}: {e}")
-                    untouched_count = 0
-                    pending_total = 0
-                    won_total = 0
-                    lost_total = 0
-                    hot_total = 0
-                    warm_total = 0
-                    cold_total = 0
-                
-                untouched_counts.append(untouched_count)
-                hot_counts.append(hot_total)
-                warm_counts.append(warm_total)
-                cold_counts.append(cold_total)
-                pending_counts.append(pending_total)
-                won_counts.append(won_total)
-                lost_counts.append(lost_total)
-            
-            assigned_df["Untouched"] = untouched_counts
-            assigned_df["Hot"] = hot_counts
-            assigned_df["Warm"] = warm_counts
-            assigned_df["Cold"] = cold_counts
-            assigned_df["Open leads"] = pending_counts
-            assigned_df["Won"] = won_counts
-            assigned_df["Lost"] = lost_counts
+                        branch_mask_pfm = pd.Series(True, index=df_pfm.index)
+                    df_pfm_flags = pd.DataFrame({
+                        "ps_name": df_pfm["ps_name"],
+                        "Untouched": df_pfm["is_untouched"].astype(int),
+                        "Hot": (pending_mask_pfm & (category_pfm == "Hot") & branch_mask_pfm).astype(int),
+                        "Warm": (pending_mask_pfm & (category_pfm == "Warm") & branch_mask_pfm).astype(int),
+                        "Cold": (pending_mask_pfm & (category_pfm == "Cold") & branch_mask_pfm).astype(int),
+                        "Open leads": pending_mask_pfm.astype(int),
+                        "Won": (final_status_pfm == "won").astype(int),
+                        "Lost": (final_status_pfm == "lost").astype(int),
+                    })
+                    ps_metrics = df_pfm_flags.groupby("ps_name", observed=True)[ps_metric_cols].sum()
+                else:
+                    ps_metrics = pd.DataFrame(columns=ps_metric_cols)
+            except Exception as e:
+                st.write(f"Error calculating PS metrics: {e}")
+                ps_metrics = pd.DataFrame(columns=ps_metric_cols)
+
+            for metric_col in ps_metric_cols:
+                assigned_df[metric_col] = assigned_df["PS"].map(ps_metrics[metric_col]).fillna(0).astype(int)
+            assigned_df.loc[assigned_df["PS"] == "Unassigned PS", ps_metric_cols] = 0
             
             # Create a copy with all columns for Open leads table
             assigned_df_full = assigned_df.copy()
@@ -1981,25 +1068,10 @@ with tab2:
                         open_leads_display = assigned_df_full_display
                     st.dataframe(open_leads_display, use_container_width=True, height=height_ps, hide_index=True)
                 # Underlying PS Follow-ups (ps_followup_master) below PS Performance (Digital)
-                show_underlying_ps = st.toggle("view underlying data", value=False, key="toggle_ps_followup_branch")
-                if show_underlying_ps:
-                    with st.container():
-                        st.subheader("PS Follow-ups (filtered by ps_assigned_at)")
-                        try:
-                            q_ps_fup = supabase.table("ps_followup_master").select("*")
-                            if (
-                                filter_option_ps != "All time"
-                                and start_dt_ps is not None
-                                and end_dt_ps is not None
-                            ):
-                                q_ps_fup = q_ps_fup.gte("ps_assigned_at", start_dt_ps.isoformat()).lte("ps_assigned_at", end_dt_ps.isoformat())
-                            ps_fup_res = q_ps_fup.execute()
-                            df_ps_fup = pd.DataFrame(ps_fup_res.data)
-
-                            st.caption(f"Rows: {len(df_ps_fup)}")
-                            st.dataframe(df_ps_fup, use_container_width=True, hide_index=False)
-                        except Exception as err:
-                            st.warning(f"Could not load ps_followup_master table: {err}")
+                render_underlying_data(
+                    "toggle_ps_followup_branch", "PS Follow-ups (filtered by ps_assigned_at)",
+                    "ps_followup_master", "ps_assigned_at", start_dt_ps, end_dt_ps,
+                )
 
             # Right side: PS Performance (Walkin) - shares PS list and branch filter
             with _ps_right_col:
@@ -2009,141 +1081,40 @@ with tab2:
                 with header_right:
                     st.caption(f"Branch: {selected_branch}")
                 try:
-                    # Fetch unique PS from walkin_table.ps_assigned with branch/global filters
-                    q_walkin_ps = (
-                        supabase
-                        .table("walkin_table")
-                        .select("ps_assigned, created_at, branch")
-                    )
-                    # Apply branch filter from Digital selection if not All
-                    if selected_branch != "All":
-                        q_walkin_ps = q_walkin_ps.eq("branch", selected_branch)
-                    # Apply global date filter on created_at
-                    if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                        q_walkin_ps = q_walkin_ps.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-                    res_walkin_ps = q_walkin_ps.execute()
-                    df_walkin_ps = pd.DataFrame(res_walkin_ps.data)
-
-                    if not df_walkin_ps.empty and "ps_assigned" in df_walkin_ps.columns:
-                        ps_unique_series = (
-                            df_walkin_ps["ps_assigned"].fillna("").astype(str).str.strip().replace("", "Unassigned PS")
-                        )
-                        ps_unique = (
-                            pd.Series(sorted(ps_unique_series.unique()))
-                            .rename("PS")
-                            .to_frame()
+                    # One pass over the window's walkins (the frame the Overall tab uses):
+                    # Punched, Untouched (no first call), Open leads and Lost by created_at,
+                    # Won by updated_at; PS are those with walkins created in the window
+                    df_walkin_ps = unwrap(prefetched, "walkin")
+                    bounded_walkin_ps = filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None
+                    in_created_walkin_ps = window_predicate("created_at", bounded_walkin_ps)
+                    if not df_walkin_ps.empty and has_column("walkin_table", "ps_assigned"):
+                        if selected_branch != "All":
+                            df_walkin_ps = df_walkin_ps[fill_label(df_walkin_ps["branch"], "Unknown") == selected_branch]
+                        walkin_display = sql(
+                            f"""
+                            SELECT
+                                CAST(ps AS VARCHAR) AS "PS",
+                                COUNT(*) FILTER (WHERE {in_created_walkin_ps}) AS "Punched",
+                                COUNT(*) FILTER (WHERE {in_created_walkin_ps} AND NOT has_first_call) AS "Untouched",
+                                COUNT(*) FILTER (WHERE {in_created_walkin_ps} AND status = 'pending') AS "Open leads",
+                                COUNT(*) FILTER (WHERE {window_predicate("updated_at", bounded_walkin_ps)} AND status = 'won') AS "Won",
+                                COUNT(*) FILTER (WHERE {in_created_walkin_ps} AND status = 'lost') AS "Lost"
+                            FROM walkin
+                            GROUP BY ps
+                            HAVING COUNT(*) FILTER (WHERE {in_created_walkin_ps}) > 0
+                            """,
+                            {"start": start_dt_global, "end": end_dt_global} if bounded_walkin_ps else None,
+                            walkin=df_walkin_ps.assign(ps=fill_label(df_walkin_ps["ps_assigned"], "Unassigned PS")),
                         )
                     else:
-                        ps_unique = pd.DataFrame({"PS": []})
-
-                    # Compute Punched, Untouched, Pending, Won and Lost counts per PS
-                    ps_names = ps_unique["PS"].tolist()
-                    punched_counts = []
-                    untouched_counts = []
-                    pending_counts = []
-                    won_counts = []
-                    lost_counts = []
-                    for ps_name in ps_names:
-                        # Map display "Unassigned PS" back to empty string for filtering
-                        ps_filter_val = "" if str(ps_name).strip().lower() == "unassigned ps" else ps_name
-                        try:
-                            q_cnt = (
-                                supabase
-                                .table("walkin_table")
-                                .select("id", count="exact")
-                                .eq("ps_assigned", ps_filter_val)
-                            )
-                            if selected_branch != "All":
-                                q_cnt = q_cnt.eq("branch", selected_branch)
-                            if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                                q_cnt = q_cnt.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-                            r_cnt = q_cnt.execute()
-                            punched_counts.append(int(r_cnt.count or 0))
-                        except Exception:
-                            punched_counts.append(0)
-
-                        # Untouched = rows where first_call_date IS NULL
-                        try:
-                            q_ut = (
-                                supabase
-                                .table("walkin_table")
-                                .select("id", count="exact")
-                                .eq("ps_assigned", ps_filter_val)
-                                .is_("first_call_date", "null")
-                            )
-                            if selected_branch != "All":
-                                q_ut = q_ut.eq("branch", selected_branch)
-                            if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                                q_ut = q_ut.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-                            r_ut = q_ut.execute()
-                            untouched_counts.append(int(r_ut.count or 0))
-                        except Exception:
-                            untouched_counts.append(0)
-
-                        # Pending = rows where status = 'Pending' (date filter on created_at)
-                        try:
-                            q_pend = (
-                                supabase
-                                .table("walkin_table")
-                                .select("id", count="exact")
-                                .eq("ps_assigned", ps_filter_val)
-                                .eq("status", "Pending")
-                            )
-                            if selected_branch != "All":
-                                q_pend = q_pend.eq("branch", selected_branch)
-                            if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                                q_pend = q_pend.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-                            r_pend = q_pend.execute()
-                            pending_counts.append(int(r_pend.count or 0))
-                        except Exception:
-                            pending_counts.append(0)
-
-                        # Won = rows where status = 'Won' (date filter on updated_at)
-                        try:
-                            q_won = (
-                                supabase
-                                .table("walkin_table")
-                                .select("id", count="exact")
-                                .eq("ps_assigned", ps_filter_val)
-                                .eq("status", "Won")
-                            )
-                            if selected_branch != "All":
-                                q_won = q_won.eq("branch", selected_branch)
-                            if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                                q_won = q_won.gte("updated_at", start_dt_global.isoformat()).lte("updated_at", end_dt_global.isoformat())
-                            r_won = q_won.execute()
-                            won_counts.append(int(r_won.count or 0))
-                        except Exception:
-                            won_counts.append(0)
-
-                        # Lost = rows where status = 'Lost' (date filter on created_at)
-                        try:
-                            q_lost = (
-                                supabase
-                                .table("walkin_table")
-                                .select("id", count="exact")
-                                .eq("ps_assigned", ps_filter_val)
-                                .eq("status", "Lost")
-                            )
-                            if selected_branch != "All":
-                                q_lost = q_lost.eq("branch", selected_branch)
-                            if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-                                q_lost = q_lost.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-                            r_lost = q_lost.execute()
-                            lost_counts.append(int(r_lost.count or 0))
-                        except Exception:
-                            lost_counts.append(0)
+                        walkin_display = pd.DataFrame({"PS": [], "Punched": [], "Untouched": [], "Open leads": [], "Won": [], "Lost": []})
 
-                    # Calculate Conversion(%) = Won/Punched*100
-                    conversion_pcts = []
-                    for i in range(len(ps_names)):
-                        if punched_counts[i] > 0:
-                            conv_pct = round((won_counts[i] / punched_counts[i]) * 100, 2)
-                        else:
-                            conv_pct = 0.0
-                        conversion_pcts.append(conv_pct)
-
-                    walkin_display = pd.DataFrame({"PS": ps_names, "Punched": punched_counts, "Untouched": untouched_counts, "Open leads": pending_counts, "Won": won_counts, "Lost": lost_counts, "Conversion(%)": conversion_pcts})
+                    # Conversion(%) = Won/Punched*100
+                    walkin_display["Conversion(%)"] = (
+                        (walkin_display["Won"] / walkin_display["Punched"].where(walkin_display["Punched"] > 0) * 100)
+                        .round(2)
+                        .fillna(0.0)
+                    )
                     # Sort by conversion percentage descending, then by PS name ascending
                     walkin_display = walkin_display.sort_values(["Conversion(%)", "PS"], ascending=[False, True])
                     # Append TOTAL row
@@ -2163,164 +1134,52 @@ with tab2:
                     st.dataframe(pd.DataFrame({"PS": [], "Punched": [], "Untouched": [], "Pending": [], "Won": [], "Lost": [], "Conversion(%)": []}), use_container_width=True, hide_index=True, height=height_ps)
 
                 # Underlying Walkin data (walkin_table) below PS Performance (Walkin)
-                show_underlying_walkin = st.toggle("view underlying data", value=False, key="toggle_walkin_branch")
-                if show_underlying_walkin:
-                    with st.container():
-                        st.subheader("Walkin (filtered by created_at)")
-                        try:
-                            q_walkin_under = supabase.table("walkin_table").select("*")
-                            if (
-                                filter_option_global != "All time"
-                                and start_dt_global is not None
-                                and end_dt_global is not None
-                            ):
-                                q_walkin_under = q_walkin_under.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-                            walkin_under_res = q_walkin_under.execute()
-                            df_walkin_under = pd.DataFrame(walkin_under_res.data)
-
-                            st.caption(f"Rows: {len(df_walkin_under)}")
-                            st.dataframe(df_walkin_under, use_container_width=True, hide_index=False)
-                        except Exception as err:
-                            st.warning(f"Could not load walkin_table: {err}")
+                render_underlying_data(
+                    "toggle_walkin_branch", "Walkin (filtered by created_at)",
+                    "walkin_table", "created_at", start_dt_global, end_dt_global,
+                )
         else:
             st.info("No PS records available for the selected range/branch.")
     except Exception as err:
         st.warning(f"Could not load PS Performance data: {err}")
 
-with tab3:
+
+# Also a fragment, so its underlying-data panel never reruns the KPI row or other tabs
+@fragment
+def render_cre_tab() -> None:
+    prefetched = run_concurrently(TAB_FETCHES["cre"])
     st.subheader("CRE Performance")
     cre_tab_left, _cre_tab_right = st.columns([0.5, 0.5])
     try:
-        cre_res = (
-            supabase
-            .table("lead_master")
-            .select("cre_name", "created_at", "lead_status", "first_call_date", "final_status", "tat", "ps_name")
-            .execute()
-        )
-        df_cre = pd.DataFrame(cre_res.data)
-
-        # Apply global date filter (same as KPIs)
-        df_cre_filtered = df_cre.copy()
-        if filter_option_global != "All time" and start_dt_global is not None and end_dt_global is not None:
-            if not df_cre.empty and "created_at" in df_cre.columns:
-                created_ts_cre = pd.to_datetime(df_cre["created_at"], errors="coerce", utc=True)
-                mask_cre = created_ts_cre.between(start_dt_global, end_dt_global)
-                df_cre_filtered = df_cre.loc[mask_cre].copy()
-
-        if not df_cre_filtered.empty and "cre_name" in df_cre_filtered.columns:
-            cre_series = (
-                df_cre_filtered["cre_name"].fillna("").astype(str).str.strip().replace("", "Unassigned Leads")
-            )
-            lead_status_series = df_cre_filtered.get("lead_status", pd.Series(dtype=object)).fillna("").astype(str).str.strip().str.lower()
-            final_status_series = df_cre_filtered.get("final_status", pd.Series(dtype=object)).fillna("").astype(str).str.strip().str.lower()
-            first_call_clean = df_cre_filtered.get("first_call_date", pd.Series(dtype=object)).fillna("").astype(str).str.strip()
-            final_status_is_null = df_cre_filtered["final_status"].isna() if "final_status" in df_cre_filtered.columns else pd.Series(False, index=df_cre_filtered.index)
-
-            touched_statuses = {"rnr", "busy on another call", "call disconnected", "call not connected"}
-            touched_mask = (
-                lead_status_series.isin(touched_statuses)
-                & (first_call_clean == "")
-                & (final_status_series == "pending")
-            )
-            ut_mask = (
-                (first_call_clean == "")
-                & (lead_status_series == "pending")
-                & ((final_status_series == "pending") | (final_status_is_null))
-            )
-            followup_mask = (
-                (first_call_clean == "")
-                & (lead_status_series == "call me back")
-                & ((final_status_series == "pending") | (final_status_is_null))
-            )
-            open_mask = (
-                (first_call_clean != "")
-                & (final_status_series == "pending")
-            )
-
-            df_tmp = pd.DataFrame({
-                "CRE": cre_series,
-                "touched_flag": touched_mask.astype(int),
-                "ut_flag": ut_mask.astype(int),
-                "followup_flag": followup_mask.astype(int),
-                "open_flag": open_mask.astype(int),
-            })
-            df_tmp_valid = df_tmp[df_tmp["CRE"] != "Unassigned Leads"].copy()
-            agg_counts = (
-                df_tmp_valid
-                .groupby("CRE")[ ["touched_flag", "ut_flag", "followup_flag", "open_flag"] ]
-                .sum()
-                .astype(int)
-                .reset_index()
-                .rename(columns={"touched_flag": "Touched", "ut_flag": "Untouched", "followup_flag": "Followup", "open_flag": "Open leads"})
-            )
-            assigned_counts = (
-                df_tmp_valid
-                .groupby("CRE")
-                .size()
-                .reset_index(name="Assigned")
-            )
-
-            # QL: count of rows where ps_name exists for each CRE (within filtered range)
-            # Build a mask aligned with df_cre_filtered index for rows where ps_name exists
-            if "ps_name" in df_cre_filtered.columns:
-                ps_series_raw = df_cre_filtered["ps_name"]
-            else:
-                ps_series_raw = pd.Series([""] * len(df_cre_filtered), index=df_cre_filtered.index)
-            ps_exists_mask = ps_series_raw.notna() & (ps_series_raw.astype(str).str.strip() != "")
-            cre_norm_for_ql = (
-                df_cre_filtered["cre_name"].fillna("").astype(str).str.strip().replace("", "Unassigned Leads")
-            )
-            ql_counts = (
-                cre_norm_for_ql[ps_exists_mask]
-                .value_counts()
-                .rename_axis("CRE")
-                .reset_index(name="Quality Leads")
-            )
-
-            df_status = pd.DataFrame({
-                "CRE": cre_series,
-                "final_status_clean": final_status_series,
-            })
-            df_status_valid = df_status[df_status["CRE"] != "Unassigned Leads"].copy()
-            won_counts_status = (
-                df_status_valid[df_status_valid["final_status_clean"] == "won"].groupby("CRE").size().reset_index(name="Retailed")
-            )
-            lost_counts_status = (
-                df_status_valid[df_status_valid["final_status_clean"] == "lost"].groupby("CRE").size().reset_index(name="Lost")
-            )
-
-            tat_series_raw = pd.to_numeric(df_cre_filtered.get("tat", pd.Series(dtype=float)), errors="coerce")
-            df_tat = pd.DataFrame({"CRE": cre_series, "tat_sec": tat_series_raw})
-            df_tat_valid = df_tat[(df_tat["CRE"] != "Unassigned Leads") & (df_tat["tat_sec"].notna())].copy()
-            tat_avg_map = df_tat_valid.groupby("CRE")["tat_sec"].mean() if not df_tat_valid.empty else pd.Series(dtype=float)
-
-            cre_names = pd.Series(sorted(df_tmp_valid["CRE"].unique())).rename("CRE").to_frame()
-            cre_table = (
-                cre_names
-                .merge(agg_counts, on="CRE", how="left")
-                .merge(assigned_counts, on="CRE", how="left")
-                .merge(ql_counts, on="CRE", how="left")
-                .merge(won_counts_status, on="CRE", how="left")
-                .merge(lost_counts_status, on="CRE", how="left")
-                .fillna({"Touched": 0, "UT": 0, "Followup": 0, "Open leads": 0, "Assigned": 0})
-            )
-            cre_table["Touched"] = cre_table["Touched"].astype(int)
-            if "Untouched" in cre_table.columns:
-                cre_table["Untouched"] = cre_table["Untouched"].astype(int)
-            cre_table["Followup"] = cre_table["Followup"].astype(int)
-            cre_table["Assigned"] = cre_table["Assigned"].astype(int)
-            if "Quality Leads" in cre_table.columns:
-                cre_table["Quality Leads"] = cre_table["Quality Leads"].fillna(0).astype(int)
-            if "Open leads" in cre_table.columns:
-                cre_table["Open leads"] = cre_table["Open leads"].astype(int)
-            if "Retailed" in cre_table.columns:
-                cre_table["Retailed"] = cre_table["Retailed"].fillna(0).astype(int)
-            if "Lost" in cre_table.columns:
-                cre_table["Lost"] = cre_table["Lost"].fillna(0).astype(int)
-
-            tat_avg_df = tat_avg_map.rename("tat_avg_sec").reset_index() if not tat_avg_map.empty else pd.DataFrame({"CRE": [], "tat_avg_sec": []})
-            cre_table = cre_table.merge(tat_avg_df, on="CRE", how="left")
-            cre_table["tat_avg_sec"] = cre_table["tat_avg_sec"].fillna(0.0)
+        df_cre = unwrap(prefetched, "lead_rollup")
+        # Leads by created_at day, per CRE (leads without a CRE are left out)
+        cre_table = sql(
+            """
+            SELECT
+                CAST(cre_name AS VARCHAR) AS "CRE",
+                SUM(leads) AS "Assigned",
+                SUM(ql) AS "Quality Leads",
+                SUM(untouched) AS "Untouched",
+                SUM(open) AS "Open leads",
+                SUM(won) AS "Retailed",
+                SUM(lost) AS "Lost",
+                SUM(tat_sum) AS tat_sum,
+                SUM(tat_count) AS tat_count
+            FROM rollup
+            WHERE basis = 'created_at' AND cre_name IS NOT NULL AND CAST(cre_name AS VARCHAR) <> 'Unassigned Leads'
+            GROUP BY 1
+            ORDER BY 1
+            """,
+            rollup=df_cre,
+        ) if not df_cre.empty else pd.DataFrame()
+
+        if not cre_table.empty:
+            count_cols_cre = ["Assigned", "Quality Leads", "Untouched", "Open leads", "Retailed", "Lost", "tat_count"]
+            cre_table[count_cols_cre] = cre_table[count_cols_cre].astype(int)
+            # Average TAT in seconds over leads with a numeric tat
+            cre_table["tat_avg_sec"] = (cre_table["tat_sum"] / cre_table["tat_count"].where(cre_table["tat_count"] > 0)).fillna(0.0)
+            total_tat_count = int(cre_table["tat_count"].sum())
+            total_avg_tat_sec = float(cre_table["tat_sum"].sum()) / total_tat_count if total_tat_count else 0.0
 
             def _format_tat(seconds: float) -> str:
                 try:
@@ -2348,7 +1207,6 @@ with tab3:
             # Include Quality Leads in totals if present
             if "Quality Leads" in cre_table.columns:
                 total_row_dict["Quality Leads"] = int(cre_table["Quality Leads"].sum())
-            total_avg_tat_sec = float(df_tat_valid["tat_sec"].mean()) if not df_tat_valid.empty else 0.0
             total_row_dict["TAT(Avg)"] = _format_tat(total_avg_tat_sec)
 
             try:
@@ -2392,23 +1250,21 @@ with tab3:
     except Exception as err:
         st.warning(f"Could not load CRE Performance data: {err}")
 
-    # Lead Master table (filtered by global date range on created_at)
-    show_underlying_lm = st.toggle("view underlying data", value=False, key="toggle_lead_master_cre")
-    if show_underlying_lm:
-        with st.container():
-            st.subheader("Lead Master (filtered)")
-            try:
-                q_lm_tab3 = supabase.table("lead_master").select("*")
-                if (
-                    filter_option_global != "All time"
-                    and start_dt_global is not None
-                    and end_dt_global is not None
-                ):
-                    q_lm_tab3 = q_lm_tab3.gte("created_at", start_dt_global.isoformat()).lte("created_at", end_dt_global.isoformat())
-                lm_res_tab3 = q_lm_tab3.execute()
-                df_lm_tab3 = pd.DataFrame(lm_res_tab3.data)
+    # Lead Master table (filtered by global date range on created_at); every column is
+    # only needed here, so this stays a separate on-demand fetch
+    render_underlying_data(
+        "toggle_lead_master_cre", "Lead Master (filtered)",
+        "lead_master", "created_at", start_dt_global, end_dt_global,
+    )
 
-                st.caption(f"Rows: {len(df_lm_tab3)}")
-                st.dataframe(df_lm_tab3, use_container_width=True, hide_index=False)
-            except Exception as err:
-                st.warning(f"Could not load lead_master table: {err}")
\ No newline at end of file
+
+# Horizontal navigation tabs for different dashboard sections. on_change="rerun" makes the
+# tabs stateful, so each container's .open tells whether that tab is showing
+tab1, tab2, tab3 = st.tabs(["Overall", "Branch Performance", "👥 CRE Performance"], key="dashboard_tab", on_change="rerun")
+for tab, render_tab in ((tab1, render_overall_tab), (tab2, render_branch_tab), (tab3, render_cre_tab)):
+    if tab.open:
+        with tab:
+            render_tab()
+
+render_stale_notice(stale_notice)
+end_render()
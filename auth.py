@@ -2,9 +2,10 @@ import streamlit as st
 import hashlib
 from datetime import datetime
 from typing import Dict, Optional, List
-from supabase import create_client, Client
+from supabase import Client
 import os
 from dotenv import load_dotenv
+from query_stats import render_timing_panel
 
 # Load environment variables
 load_dotenv()
@@ -287,6 +288,8 @@ def show_sidebar_navigation():
                 if st.button("👥 Manage Users", use_container_width=True, type="primary" if users_active else "secondary"):
                     st.session_state.show_user_management = True
                     st.rerun()
+                # Supabase request timings of this session's previous render
+                render_timing_panel()
             
             # Logout button fixed at bottom
             st.markdown('<div class="logout-fixed">', unsafe_allow_html=True)
@@ -0,0 +1,214 @@
+"""
+Offline render benchmark of the dashboard against synthetic Supabase data.
+
+Generates the dashboard tables at the requested scale (synthetic_supabase.py),
+serves them from a local PostgREST-compatible stub and renders every tab for
+each date filter with Streamlit's ``AppTest``: once cold (empty caches and
+snapshots, as after a deploy) and ``--repeat`` times warm (a new session with
+the process caches filled). Timings and the Supabase requests each render made
+(from query_stats) are written as JSON, so runs can be compared over time::
+
+    python benchmark.py --scale 100k --latency-ms 30 --output bench-100k.json
+    python benchmark.py --scale 100k --latency-ms 30 --baseline bench-100k.json
+
+Nothing here talks to the real project: the Supabase URL and key are replaced
+with the stub's before the app modules are imported.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from synthetic_supabase import STUB_ANON_KEY, StubServer, make_tables, parse_scale
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+TAB_LABELS = ["Overall", "Branch Performance", "👥 CRE Performance"]
+DEFAULT_FILTERS = ["MTD", "Today", "All time"]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(APP_PATH),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _request_totals() -> Dict[str, float]:
+    import query_stats
+
+    with query_stats._lock:
+        totals = list(query_stats._process_totals.values())
+    return {
+        "requests": sum(t["calls"] for t in totals),
+        "bytes": sum(t["bytes"] for t in totals),
+        "query_seconds": sum(t["seconds"] for t in totals),
+    }
+
+
+def _reset_caches(snapshot_dir: str) -> None:
+    """Forget everything a running process has cached, as after a fresh deploy"""
+    import streamlit as st
+
+    import data_access
+    import kpis
+    import rollups
+
+    st.cache_data.clear()
+    data_access.invalidate()
+    data_access._snapshots.clear()
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    # Re-probe optional server objects (the stub reports both missing unless --rollup)
+    rollups._rollup_available = True
+    kpis._rpc_available = True
+
+
+def _render(tab: str, option: str, timeout: float) -> Dict[str, Any]:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state["authenticated"] = True
+    at.session_state["user"] = {"username": "benchmark", "role": "user"}
+    at.session_state["dashboard_tab"] = tab
+    at.session_state["global_filter"] = option
+    before = _request_totals()
+    started = time.perf_counter()
+    at.run()
+    seconds = time.perf_counter() - started
+    after = _request_totals()
+    return {
+        "seconds": seconds,
+        **{key: after[key] - before[key] for key in after},
+        "errors": [str(e.value) for e in at.exception],
+    }
+
+
+def run_benchmark(filters: List[str], repeat: int, timeout: float, snapshot_dir: str) -> List[Dict[str, Any]]:
+    results = []
+    for option in filters:
+        for tab in TAB_LABELS:
+            _reset_caches(snapshot_dir)
+            cold = _render(tab, option, timeout)
+            warm = [_render(tab, option, timeout) for _ in range(repeat)]
+            warm_seconds = [w["seconds"] for w in warm]
+            results.append({
+                "filter": option,
+                "tab": tab,
+                "cold_seconds": round(cold["seconds"], 4),
+                "cold_requests": cold["requests"],
+                "cold_bytes": cold["bytes"],
+                "cold_query_seconds": round(cold["query_seconds"], 4),
+                "warm_seconds": [round(s, 4) for s in warm_seconds],
+                "warm_median_seconds": round(statistics.median(warm_seconds), 4) if warm_seconds else None,
+                "warm_requests": max((w["requests"] for w in warm), default=0),
+                "errors": sorted({e for r in [cold, *warm] for e in r["errors"]}),
+            })
+            print(
+                f"{option:>9} | {tab:<20} cold {cold['seconds']:7.2f}s ({cold['requests']} requests)"
+                f"  warm {results[-1]['warm_median_seconds'] or 0:7.2f}s",
+                file=sys.stderr,
+            )
+    return results
+
+
+def _compare(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = {(r["filter"], r["tab"]): r for r in json.load(f)["results"]}
+    print(f"\nChange vs {baseline_path} (negative is faster)", file=sys.stderr)
+    for result in results:
+        previous = baseline.get((result["filter"], result["tab"]))
+        if previous is None:
+            continue
+        changes = []
+        for key in ("cold_seconds", "warm_median_seconds"):
+            if previous.get(key) and result.get(key) is not None:
+                changes.append(f"{key.split('_')[0]} {(result[key] - previous[key]) / previous[key] * 100:+6.1f}%")
+        print(f"{result['filter']:>9} | {result['tab']:<20} " + "  ".join(changes), file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time dashboard renders against synthetic Supabase data")
+    parser.add_argument("--scale", type=parse_scale, default=parse_scale("10k"), help="lead_master rows, e.g. 10k, 100k, 1m")
+    parser.add_argument("--filters", default=",".join(DEFAULT_FILTERS), help="comma-separated date filter options")
+    parser.add_argument("--repeat", type=int, default=3, help="warm renders per tab and filter")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay the stub adds to every response")
+    parser.add_argument("--max-rows", type=int, default=1000, help="stub row cap per response")
+    parser.add_argument("--rollup", action="store_true", help="serve lead_daily_rollup instead of reporting it missing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds allowed per render")
+    parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON results to print relative changes against")
+    args = parser.parse_args()
+
+    generated_at = time.perf_counter()
+    tables = make_tables(args.scale, seed=args.seed)
+    generate_seconds = time.perf_counter() - generated_at
+    server = StubServer(tables, latency_ms=args.latency_ms, max_rows=args.max_rows)
+    snapshot_dir = tempfile.mkdtemp(prefix="dashboard-bench-")
+    # Point the app at the stub before any app module reads its settings
+    os.environ.update({
+        "SUPABASE_URL": server.url,
+        "SUPABASE_ANON_KEY": STUB_ANON_KEY,
+        "DASHBOARD_SNAPSHOT_DIR": snapshot_dir,
+        "DASHBOARD_WARM_FILTERS": "",
+        "DASHBOARD_QUERY_LOG_LEVEL": "WARNING",
+    })
+    if args.rollup:
+        import data_access
+        import rollups
+
+        leads = data_access._add_status_flags("lead_master", data_access._normalize(tables["lead_master"].copy()))
+        rollup = rollups.rollup_from_rows(leads)
+        rollup["day"] = rollup["day"].map(lambda d: d.isoformat() if pd.notna(d) else None)
+        rollup = rollup.astype(object).where(rollup.notna(), None)
+        rollup.insert(0, "id", range(1, len(rollup) + 1))
+        server.add_table(rollups.ROLLUP_TABLE, rollup)
+    server.start()
+    try:
+        results = run_benchmark([f.strip() for f in args.filters.split(",") if f.strip()], args.repeat, args.timeout, snapshot_dir)
+    finally:
+        server.stop()
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "rows": {name: len(frame) for name, frame in tables.items()},
+            "latency_ms": args.latency_ms,
+            "max_rows": args.max_rows,
+            "rollup": args.rollup,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "generate_seconds": round(generate_seconds, 3),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+-- Single-row aggregate behind the nine top-row KPI cards.
+-- Returns current and previous period counts in one round trip; pass NULL
+-- windows for "All time" (no date filter) and NULL previous windows when there
+-- is no comparison period.
+-- Each table is read through two branches: every row for "All time", otherwise
+-- only rows dated (on a KPI date column) between the earliest and latest bound
+-- of the two windows. Their conditions use only parameters, so Postgres runs
+-- one branch per call and the windowed one can use the date indexes below.
+-- Walkin Won is dated by walkin_table.won_timestamp; kpis.py calls this
+-- function only when the schema has that column (KPI_RPC_WON_COL) and counts
+-- the cards itself otherwise.
+CREATE OR REPLACE FUNCTION dashboard_kpis(
+    p_start TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    p_end TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    p_prev_start TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    p_prev_end TIMESTAMP WITH TIME ZONE DEFAULT NULL
+)
+RETURNS TABLE (
+    leads BIGINT,
+    leads_prev BIGINT,
+    assigned_cre BIGINT,
+    assigned_cre_prev BIGINT,
+    assigned_ps BIGINT,
+    assigned_ps_prev BIGINT,
+    pending BIGINT,
+    pending_prev BIGINT,
+    lost BIGINT,
+    lost_prev BIGINT,
+    won BIGINT,
+    won_prev BIGINT,
+    walkin BIGINT,
+    walkin_prev BIGINT,
+    walkin_won BIGINT,
+    walkin_won_prev BIGINT,
+    walkin_won_base BIGINT,
+    td_walkin BIGINT,
+    td_walkin_prev BIGINT,
+    td_ps BIGINT,
+    td_ps_prev BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH lm AS (
+        SELECT
+            COUNT(*) FILTER (WHERE p_start IS NULL OR created_at BETWEEN p_start AND p_end) AS leads,
+            COUNT(*) FILTER (WHERE p_prev_start IS NOT NULL AND created_at BETWEEN p_prev_start AND p_prev_end) AS leads_prev,
+            COUNT(*) FILTER (WHERE cre_name IS NOT NULL AND (p_start IS NULL OR created_at BETWEEN p_start AND p_end)) AS assigned_cre,
+            COUNT(*) FILTER (WHERE cre_name IS NOT NULL AND p_prev_start IS NOT NULL AND created_at BETWEEN p_prev_start AND p_prev_end) AS assigned_cre_prev,
+            COUNT(*) FILTER (WHERE ps_name IS NOT NULL AND (p_start IS NULL OR ps_assigned_at BETWEEN p_start AND p_end)) AS assigned_ps,
+            COUNT(*) FILTER (WHERE ps_name IS NOT NULL AND p_prev_start IS NOT NULL AND ps_assigned_at BETWEEN p_prev_start AND p_prev_end) AS assigned_ps_prev,
+            COUNT(*) FILTER (WHERE final_status = 'Pending' AND (p_start IS NULL OR created_at BETWEEN p_start AND p_end)) AS pending,
+            COUNT(*) FILTER (WHERE final_status = 'Pending' AND p_prev_start IS NOT NULL AND created_at BETWEEN p_prev_start AND p_prev_end) AS pending_prev,
+            COUNT(*) FILTER (WHERE final_status = 'Lost' AND (p_start IS NULL OR created_at BETWEEN p_start AND p_end)) AS lost,
+            COUNT(*) FILTER (WHERE final_status = 'Lost' AND p_prev_start IS NOT NULL AND created_at BETWEEN p_prev_start AND p_prev_end) AS lost_prev,
+            COUNT(*) FILTER (WHERE final_status = 'Won' AND (p_start IS NULL OR created_at BETWEEN p_start AND p_end)) AS won,
+            COUNT(*) FILTER (WHERE final_status = 'Won' AND p_prev_start IS NOT NULL AND created_at BETWEEN p_prev_start AND p_prev_end) AS won_prev
+        FROM (
+            SELECT * FROM lead_master WHERE p_start IS NULL
+            UNION ALL
+            SELECT * FROM lead_master
+            WHERE p_start IS NOT NULL
+              AND (created_at BETWEEN LEAST(p_start, p_prev_start) AND GREATEST(p_end, p_prev_end)
+                   OR ps_assigned_at BETWEEN LEAST(p_start, p_prev_start) AND GREATEST(p_end, p_prev_end))
+        ) scoped
+    ),
+    wk AS (
+        SELECT
+            COUNT(*) FILTER (WHERE p_start IS NULL OR created_at BETWEEN p_start AND p_end) AS walkin,
+            COUNT(*) FILTER (WHERE p_prev_start IS NOT NULL AND created_at BETWEEN p_prev_start AND p_prev_end) AS walkin_prev,
+            COUNT(*) FILTER (WHERE status = 'Won' AND (p_start IS NULL OR won_timestamp BETWEEN p_start AND p_end)) AS walkin_won,
+            COUNT(*) FILTER (WHERE status = 'Won' AND p_prev_start IS NOT NULL AND won_timestamp BETWEEN p_prev_start AND p_prev_end) AS walkin_won_prev,
+            COUNT(*) FILTER (WHERE p_start IS NULL OR won_timestamp BETWEEN p_start AND p_end) AS walkin_won_base,
+            COUNT(*) FILTER (WHERE test_drive_done AND (p_start IS NULL OR updated_at BETWEEN p_start AND p_end)) AS td_walkin,
+            COUNT(*) FILTER (WHERE test_drive_done AND p_prev_start IS NOT NULL AND updated_at BETWEEN p_prev_start AND p_prev_end) AS td_walkin_prev
+        FROM (
+            SELECT * FROM walkin_table WHERE p_start IS NULL
+            UNION ALL
+            SELECT * FROM walkin_table
+            WHERE p_start IS NOT NULL
+              AND (created_at BETWEEN LEAST(p_start, p_prev_start) AND GREATEST(p_end, p_prev_end)
+                   OR won_timestamp BETWEEN LEAST(p_start, p_prev_start) AND GREATEST(p_end, p_prev_end)
+                   OR updated_at BETWEEN LEAST(p_start, p_prev_start) AND GREATEST(p_end, p_prev_end))
+        ) scoped
+    ),
+    pf AS (
+        SELECT
+            COUNT(*) FILTER (WHERE test_drive_done AND (p_start IS NULL OR updated_at BETWEEN p_start AND p_end)) AS td_ps,
+            COUNT(*) FILTER (WHERE test_drive_done AND p_prev_start IS NOT NULL AND updated_at BETWEEN p_prev_start AND p_prev_end) AS td_ps_prev
+        FROM (
+            SELECT * FROM ps_followup_master WHERE p_start IS NULL
+            UNION ALL
+            SELECT * FROM ps_followup_master
+            WHERE p_start IS NOT NULL
+              AND (updated_at BETWEEN LEAST(p_start, p_prev_start) AND GREATEST(p_end, p_prev_end))
+        ) scoped
+    )
+    SELECT
+        lm.leads, lm.leads_prev,
+        lm.assigned_cre, lm.assigned_cre_prev,
+        lm.assigned_ps, lm.assigned_ps_prev,
+        lm.pending, lm.pending_prev,
+        lm.lost, lm.lost_prev,
+        lm.won, lm.won_prev,
+        wk.walkin, wk.walkin_prev,
+        wk.walkin_won, wk.walkin_won_prev,
+        wk.walkin_won_base,
+        wk.td_walkin, wk.td_walkin_prev,
+        pf.td_ps, pf.td_ps_prev
+    FROM lm CROSS JOIN wk CROSS JOIN pf;
+$$;
+
+-- Allow the dashboard's anon key to call the aggregate
+GRANT EXECUTE ON FUNCTION dashboard_kpis(TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE) TO anon;
+
+-- Indexes on the KPI date columns
+CREATE INDEX IF NOT EXISTS idx_lead_master_created_at ON lead_master(created_at);
+CREATE INDEX IF NOT EXISTS idx_lead_master_ps_assigned_at ON lead_master(ps_assigned_at);
+CREATE INDEX IF NOT EXISTS idx_walkin_table_created_at ON walkin_table(created_at);
+CREATE INDEX IF NOT EXISTS idx_walkin_table_updated_at ON walkin_table(updated_at);
+CREATE INDEX IF NOT EXISTS idx_walkin_table_won_timestamp ON walkin_table(won_timestamp);
+CREATE INDEX IF NOT EXISTS idx_ps_followup_master_updated_at ON ps_followup_master(updated_at);
@@ -0,0 +1,104 @@
+-- Daily lead rollup behind the Overall and CRE Performance tabs.
+-- One row per day x basis x branch x PS x CRE x source. "basis" names the
+-- timestamp the day is taken from (created_at or ps_assigned_at), so every lead
+-- is counted once under each basis; a NULL day holds leads whose basis
+-- timestamp is missing. Labels are trimmed with blanks stored as NULL,
+-- statuses are compared lower-cased and the untouched/open rules follow
+-- _add_status_flags, matching data_access.py. The dashboard answers a date
+-- window by summing these rows.
+CREATE TABLE IF NOT EXISTS lead_daily_rollup (
+    id BIGSERIAL PRIMARY KEY,
+    day TIMESTAMP WITH TIME ZONE,
+    basis TEXT NOT NULL CHECK (basis IN ('created_at', 'ps_assigned_at')),
+    branch TEXT,
+    ps_name TEXT,
+    cre_name TEXT,
+    source TEXT,
+    leads BIGINT NOT NULL DEFAULT 0,
+    assigned_cre BIGINT NOT NULL DEFAULT 0,
+    ql BIGINT NOT NULL DEFAULT 0,
+    pending BIGINT NOT NULL DEFAULT 0,
+    won BIGINT NOT NULL DEFAULT 0,
+    lost BIGINT NOT NULL DEFAULT 0,
+    td BIGINT NOT NULL DEFAULT 0,
+    untouched BIGINT NOT NULL DEFAULT 0,
+    open BIGINT NOT NULL DEFAULT 0,
+    tat_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    tat_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_lead_daily_rollup_day ON lead_daily_rollup(day);
+
+-- Rebuild the rollup rows for days on or after p_since (plus the NULL-day rows,
+-- which new unassigned leads land in); NULL rebuilds everything. Statuses of old
+-- leads keep changing, so schedule a full rebuild as well as frequent
+-- incremental ones. Returns the number of rollup rows written.
+CREATE OR REPLACE FUNCTION refresh_lead_daily_rollup(p_since TIMESTAMP WITH TIME ZONE DEFAULT NULL)
+RETURNS BIGINT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_rows BIGINT;
+BEGIN
+    DELETE FROM lead_daily_rollup
+    WHERE p_since IS NULL OR day IS NULL OR day >= date_trunc('day', p_since AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+
+    INSERT INTO lead_daily_rollup (
+        day, basis, branch, ps_name, cre_name, source,
+        leads, assigned_cre, ql, pending, won, lost, td, untouched, open, tat_sum, tat_count
+    )
+    WITH src AS (
+        SELECT
+            created_at,
+            ps_assigned_at,
+            NULLIF(BTRIM(branch), '') AS branch,
+            NULLIF(BTRIM(ps_name), '') AS ps_name,
+            NULLIF(BTRIM(cre_name), '') AS cre_name,
+            NULLIF(BTRIM(source), '') AS source,
+            NULLIF(LOWER(BTRIM(final_status)), '') AS final_status,
+            NULLIF(LOWER(BTRIM(lead_status)), '') AS lead_status,
+            NULLIF(LOWER(BTRIM(test_drive_status::TEXT)), '') AS test_drive_status,
+            NULLIF(BTRIM(first_call_date::TEXT), '') IS NULL AS first_call_missing,
+            CASE WHEN BTRIM(tat::TEXT) ~ '^-?[0-9]+(\.[0-9]+)?$' THEN BTRIM(tat::TEXT)::DOUBLE PRECISION END AS tat
+        FROM lead_master
+    ),
+    by_basis AS (
+        SELECT 'created_at' AS basis, date_trunc('day', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS day, src.* FROM src
+        UNION ALL
+        SELECT 'ps_assigned_at' AS basis, date_trunc('day', ps_assigned_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS day, src.* FROM src
+    )
+    SELECT
+        day, basis, branch, ps_name, cre_name, source,
+        COUNT(*),
+        COUNT(*) FILTER (WHERE cre_name IS NOT NULL),
+        COUNT(*) FILTER (WHERE ps_name IS NOT NULL),
+        COUNT(*) FILTER (WHERE final_status = 'pending'),
+        COUNT(*) FILTER (WHERE final_status = 'won'),
+        COUNT(*) FILTER (WHERE final_status = 'lost'),
+        COUNT(*) FILTER (WHERE test_drive_status = 'true'),
+        COUNT(*) FILTER (WHERE first_call_missing AND lead_status = 'pending' AND (final_status = 'pending' OR final_status IS NULL)),
+        COUNT(*) FILTER (WHERE NOT first_call_missing AND final_status = 'pending'),
+        COALESCE(SUM(tat), 0),
+        COUNT(tat)
+    FROM by_basis
+    WHERE p_since IS NULL OR day IS NULL OR day >= date_trunc('day', p_since AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+    GROUP BY day, basis, branch, ps_name, cre_name, source;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$;
+
+-- The dashboard reads the rollup with the anon key; refreshing needs the service role
+ALTER TABLE lead_daily_rollup ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Dashboard can read lead rollup" ON lead_daily_rollup;
+CREATE POLICY "Dashboard can read lead rollup" ON lead_daily_rollup FOR SELECT USING (true);
+GRANT SELECT ON lead_daily_rollup TO anon;
+REVOKE EXECUTE ON FUNCTION refresh_lead_daily_rollup(TIMESTAMP WITH TIME ZONE) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION refresh_lead_daily_rollup(TIMESTAMP WITH TIME ZONE) TO service_role;
+
+-- Optional: keep the rollup fresh with pg_cron (Database -> Extensions -> pg_cron)
+-- SELECT cron.schedule('lead-rollup-recent', '*/5 * * * *', $$SELECT refresh_lead_daily_rollup(now() - interval '2 days')$$);
+-- SELECT cron.schedule('lead-rollup-full', '15 2 * * *', $$SELECT refresh_lead_daily_rollup(NULL)$$);
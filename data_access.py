@@ -0,0 +1,720 @@
+"""
+Cached data access layer for the dashboard's Supabase tables.
+
+Table fetches are cached with ``st.cache_data`` so a single download is shared
+across reruns and sessions until the TTL expires or the table is invalidated.
+Result sets past PostgREST's row cap are read as concurrent ``range`` pages.
+Tables in ``SNAPSHOT_TABLES`` are mirrored in local Parquet files that only pull
+rows changed since the last sync; their fetches are answered from the mirror.
+"""
+
+import itertools
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from supabase import Client
+
+from query_scheduler import run_concurrently, with_script_ctx
+from query_stats import MAX_TRACKED_SESSIONS, instrument, record_memo, render_scope
+from resilience import forget, serve
+from supabase_client import create_supabase_client
+
+# Load environment variables
+load_dotenv()
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
+
+# How long a fetched table stays fresh (seconds); cache keys roll over at each multiple of it
+CACHE_TTL_SECONDS = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+# Entries outlive their bucket by one TTL so ones warmed ahead of time are still held when it starts
+CACHE_ENTRY_TTL_SECONDS = 2 * CACHE_TTL_SECONDS
+# Upper bound on cached result sets kept in memory per process
+CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "128"))
+# Rows requested per page; PostgREST caps responses (Supabase default: 1000 rows)
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "1000"))
+# Pages of one table fetched in parallel per process
+PAGE_WORKERS = int(os.getenv("DASHBOARD_PAGE_WORKERS", "4"))
+# Count windows up to this many days exactly; wider and open-ended windows use WIDE_COUNT_MODE
+EXACT_COUNT_MAX_DAYS = float(os.getenv("DASHBOARD_EXACT_COUNT_DAYS", "31"))
+# PostgREST count method for wide windows: "estimated" (exact up to the row cap, planner
+# statistics past it), "planned" (always planner statistics) or "exact"
+WIDE_COUNT_MODE = os.getenv("DASHBOARD_WIDE_COUNT_MODE", "estimated").strip().lower()
+
+# Tables mirrored in a local Parquet snapshot and kept current by incremental sync
+SNAPSHOT_TABLES = tuple(
+    t.strip() for t in os.getenv("DASHBOARD_SNAPSHOT_TABLES", "walkin_table,ps_followup_master").split(",") if t.strip()
+)
+# Directory of the snapshot files, which hold full customer rows (names, phone numbers); used
+# only while private to this user (see _snapshot_dir), by default a per-user temp directory
+SNAPSHOT_DIR = os.getenv("DASHBOARD_SNAPSHOT_DIR") or os.path.join(
+    tempfile.gettempdir(), f"dashboard-snapshots-{os.getuid() if hasattr(os, 'getuid') else 'user'}"
+)
+# Seconds between full re-downloads of a snapshot, which also drop rows deleted upstream
+SNAPSHOT_FULL_SYNC_SECONDS = int(os.getenv("DASHBOARD_SNAPSHOT_FULL_SYNC", "3600"))
+# Column the incremental sync watermark is taken from
+SNAPSHOT_WATERMARK_COLUMN = "updated_at"
+# Re-read rows updated slightly before the watermark, for writes committed out of order
+SNAPSHOT_WATERMARK_OVERLAP = pd.Timedelta(minutes=1)
+
+# Low-cardinality label columns, loaded as stripped categoricals (blank -> missing)
+LABEL_COLUMNS = ("branch", "ps_branch", "source", "ps_name", "cre_name", "ps_assigned", "lead_category")
+# Status columns are also case-folded, so views compare against lower-case labels
+STATUS_COLUMNS = ("status", "final_status", "lead_status", "test_drive_status")
+# Timestamp columns parsed to datetime64[ns, UTC] (unparseable values become NaT)
+TIMESTAMP_COLUMNS = ("created_at", "updated_at", "ps_assigned_at", "won_timestamp", "day")
+# Flag columns stored as real booleans ("true"/"yes"/"1" are truthy, missing is False)
+BOOL_COLUMNS = ("test_drive_done",)
+# Columns recording a lead's first call (blank counts as no call)
+FIRST_CALL_COLUMNS = ("first_call_date", "ps_first_call_date")
+# Lead statuses recording a PS contact attempt or outcome; a PS lead in one of them is not untouched
+PS_WORKED_STATUSES = (
+    "lost to codealer", "lost to competition", "dropped", "booked", "retailed",
+    "call me back", "rnr", "busy on another call", "call disconnected", "call not connected",
+)
+
+# Generation counters; bumping one makes the matching cached entries unreachable
+_cache_epoch = 0
+_table_versions: Dict[str, int] = {}
+# Per-thread bucket override set by pinned_bucket (the cache warmer works one bucket ahead)
+_clock = threading.local()
+
+# Snapshot state per table: raw frame (sorted by id), invalidation generation it was synced at,
+# monotonic time of the last sync and wall time of the last full download
+_snapshots: Dict[str, Dict[str, Any]] = {}
+_snapshot_locks: Dict[str, threading.Lock] = {}
+_snapshot_locks_guard = threading.Lock()
+
+# Count requests of each session's current render: session id -> (render number, {query key: Future})
+_count_memos: "OrderedDict[str, tuple]" = OrderedDict()
+_count_memos_lock = threading.Lock()
+
+
+@st.cache_resource
+def init_supabase() -> Client:
+    client = create_supabase_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+    instrument(client)
+    return client
+
+
+def now_bucket() -> pd.Timestamp:
+    """Current UTC time rounded up to the cache TTL so open-ended windows share cache keys"""
+    pinned = getattr(_clock, "bucket", None)
+    if pinned is not None:
+        return pinned
+    return pd.Timestamp.now(tz="UTC").ceil(f"{CACHE_TTL_SECONDS}s")
+
+
+def current_date() -> date:
+    """Today's (server-local) date, as of the start of the pinned bucket while one is pinned"""
+    pinned = getattr(_clock, "bucket", None)
+    if pinned is None:
+        return date.today()
+    return datetime.fromtimestamp((pinned - pd.Timedelta(seconds=CACHE_TTL_SECONDS)).timestamp()).date()
+
+
+@contextmanager
+def pinned_bucket(bucket: pd.Timestamp) -> Iterator[None]:
+    """Make ``now_bucket``/``current_date`` on this thread answer as if ``bucket`` were current
+
+    Lets a background job build the cache keys of the next bucket before it starts.
+    """
+    previous = getattr(_clock, "bucket", None)
+    _clock.bucket = bucket
+    try:
+        yield
+    finally:
+        _clock.bucket = previous
+
+
+def _generation(*tables: str) -> tuple:
+    return (_cache_epoch,) + tuple(_table_versions.get(t, 0) for t in tables)
+
+
+def cache_version(*tables: str) -> tuple:
+    """Cache-key component that changes whenever any of ``tables`` is invalidated or a new bucket starts"""
+    return (now_bucket(),) + _generation(*tables)
+
+
+def to_iso(value: Optional[Union[pd.Timestamp, str]]) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return pd.Timestamp(value).isoformat()
+
+
+def window_key(end_iso: Optional[str]) -> Optional[str]:
+    """``end_iso`` as it identifies a window across buckets: "now" for the bucketed current time
+
+    Open-ended windows (MTD) end at ``now_bucket()``, which changes every bucket;
+    keys built with this stay the same, so the last good result of the previous
+    bucket can stand in for the current one (see ``resilience.serve``).
+    """
+    if end_iso is not None and end_iso == to_iso(now_bucket()):
+        return "now"
+    return end_iso
+
+
+@st.cache_resource
+def _get_page_executor() -> ThreadPoolExecutor:
+    # Separate from the query_scheduler pool: fetches running there submit their pages here
+    return ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix="supabase-page")
+
+
+def _fill_page(arrays: Dict[str, np.ndarray], offset: int, rows: list) -> int:
+    """Copy one page of row dicts into the column arrays at ``offset``; returns rows written"""
+    n = min(len(rows), len(next(iter(arrays.values()))) - offset)
+    for name, arr in arrays.items():
+        arr[offset:offset + n] = np.fromiter((row.get(name) for row in rows[:n]), dtype=object, count=n)
+    return n
+
+
+def _read_pages(build_query: Callable[..., Any], on_progress: Optional[Callable[[int, int], None]]) -> pd.DataFrame:
+    """Read every row of ``build_query()`` as raw columns, past the server's row cap
+
+    The first page reports the total and the server's effective page size; the
+    remaining ranges are then requested concurrently and written straight into
+    preallocated column arrays, so the table is never held as one list of dicts:
+    only ``PAGE_WORKERS`` pages are requested ahead, and each is released once
+    copied. postgrest-py's range(start, end) is end-exclusive.
+    """
+    first = build_query(count="exact").range(0, PAGE_SIZE).execute()
+    if not first.data:
+        return pd.DataFrame()
+    step = len(first.data)
+    total = max(first.count or 0, step)
+    names = list(first.data[0].keys())
+    arrays = {name: np.empty(total, dtype=object) for name in names}
+    lengths = {0: _fill_page(arrays, 0, first.data)}
+    del first
+    if on_progress is not None:
+        on_progress(step, total)
+    remaining = iter(range(step, total, step))
+    # Pages run under the caller's script context so their requests are attributed to its session
+    ctx = get_script_run_ctx(suppress_warning=True)
+    executor = _get_page_executor()
+
+    def submit(offset: int) -> Future:
+        return executor.submit(with_script_ctx(lambda: build_query().range(offset, offset + step).execute().data, ctx))
+
+    # At most PAGE_WORKERS pages are in flight or waiting to be copied; a finished
+    # future (and the page it holds) is dropped as soon as its rows are copied
+    in_flight = {submit(offset): offset for offset in itertools.islice(remaining, PAGE_WORKERS)}
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            offset = in_flight.pop(future)
+            lengths[offset] = _fill_page(arrays, offset, future.result())
+            following = next(remaining, None)
+            if following is not None:
+                in_flight[submit(following)] = following
+        del done, future
+        if on_progress is not None:
+            on_progress(min(sum(lengths.values()), total), total)
+    # Rows deleted mid-read leave short pages; keep only the slices actually written
+    filled = [slice(offset, offset + n) for offset, n in sorted(lengths.items()) if n]
+    if len(filled) != 1 or filled[0] != slice(0, total):
+        arrays = {name: np.concatenate([arr[sl] for sl in filled]) for name, arr in arrays.items()}
+    return pd.DataFrame(arrays, copy=False).infer_objects()
+
+
+def _clean_labels(values: pd.Series, casefold: bool) -> pd.Series:
+    # Strip (and optionally case-fold) each distinct value once, then remap the codes
+    raw = values.astype("category")
+    labels = raw.cat.categories.astype(str).str.strip()
+    if len(labels) == 0:
+        return raw
+    if casefold:
+        labels = labels.str.lower()
+    label_codes, categories = pd.factorize(labels.where(labels != ""))
+    codes = raw.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, label_codes[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=values.index, name=values.name)
+
+
+def _normalize(frame: pd.DataFrame) -> pd.DataFrame:
+    """Give the known label, status, timestamp and flag columns compact, comparable dtypes"""
+    for col in frame.columns:
+        if col in LABEL_COLUMNS or col in STATUS_COLUMNS:
+            frame[col] = _clean_labels(frame[col], casefold=col in STATUS_COLUMNS)
+        elif col in TIMESTAMP_COLUMNS:
+            # PostgREST trims trailing zeros from fractional seconds; an inferred format would drop other precisions
+            frame[col] = pd.to_datetime(frame[col], errors="coerce", utc=True, format="ISO8601")
+        elif col in BOOL_COLUMNS:
+            flag = frame[col]
+            if pd.api.types.is_bool_dtype(flag):
+                frame[col] = flag.fillna(False).astype(bool)
+            else:
+                frame[col] = flag.astype(str).str.strip().str.lower().isin(["true", "yes", "1"])
+    return frame
+
+
+def _add_status_flags(table: str, frame: pd.DataFrame) -> pd.DataFrame:
+    """Classify each row once at load with the bool flags the views aggregate on
+
+    ``has_first_call`` everywhere a first-call column is fetched; ``is_open``
+    (called, still pending) and ``is_untouched`` (not called, still pending)
+    where the status columns are fetched too, with each table's rule;
+    ``is_touched`` (called, still pending) for walkins. Flags whose inputs are
+    not in the projection are left out.
+    """
+    first_call_col = next((col for col in FIRST_CALL_COLUMNS if col in frame.columns), None)
+    if first_call_col is None:
+        return frame
+    called = frame[first_call_col].fillna("").astype(str).str.strip() != ""
+    frame["has_first_call"] = called
+    if table == "walkin_table":
+        if "status" in frame.columns:
+            pending = frame["status"] == "pending"
+            frame["is_touched"] = pending & called
+            frame["is_untouched"] = pending & ~called
+        return frame
+    if "final_status" not in frame.columns:
+        return frame
+    final_status = frame["final_status"]
+    frame["is_open"] = called & (final_status == "pending")
+    if "lead_status" in frame.columns:
+        lead_status = frame["lead_status"]
+        not_closed = (final_status == "pending") | final_status.isna()
+        if table == "lead_master":
+            # CRE rule: the lead itself is still marked pending
+            frame["is_untouched"] = ~called & not_closed & (lead_status == "pending")
+        elif table == "ps_followup_master":
+            # PS rule: no contact attempt or outcome recorded yet
+            frame["is_untouched"] = ~called & not_closed & ~lead_status.isin(PS_WORKED_STATUSES)
+    return frame
+
+
+def fill_label(values: pd.Series, default: str) -> pd.Series:
+    """Label column with missing values shown as ``default``
+
+    Works on the categoricals produced by ``fetch_table`` and on plain columns.
+    Categoricals keep every category of the fetched frame, so count with
+    ``observed=True`` (or drop zero counts) after masking.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        if default not in values.cat.categories:
+            values = values.cat.add_categories([default])
+        return values.fillna(default)
+    return values.fillna("").astype(str).str.strip().replace("", default)
+
+
+def _window_clause(col: str, start_iso: Optional[str], end_iso: Optional[str]) -> str:
+    # Values are quoted because ISO timestamps contain reserved characters (":", "+")
+    bounds = []
+    if start_iso is not None:
+        bounds.append(f'{col}.gte."{start_iso}"')
+    if end_iso is not None:
+        bounds.append(f'{col}.lte."{end_iso}"')
+    return f"and({','.join(bounds)})"
+
+
+def _snapshot_dir() -> Optional[str]:
+    # SNAPSHOT_DIR, created with mode 0700, or None unless it is a real directory that only this
+    # user can read and write (e.g. a shared temp path someone else created first)
+    try:
+        os.makedirs(SNAPSHOT_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(SNAPSHOT_DIR)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode):
+        return None
+    if hasattr(os, "getuid") and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        return None
+    return SNAPSHOT_DIR
+
+
+def _snapshot_paths(table: str) -> Optional[tuple]:
+    directory = _snapshot_dir()
+    if directory is None:
+        return None
+    return os.path.join(directory, f"{table}.parquet"), os.path.join(directory, f"{table}.json")
+
+
+def _load_snapshot(table: str) -> Optional[Dict[str, Any]]:
+    paths = _snapshot_paths(table)
+    if paths is None:
+        return None
+    data_path, meta_path = paths
+    try:
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+        frame = pd.read_parquet(data_path)
+    except (OSError, ValueError, ImportError):
+        return None
+    return {"frame": frame, "version": None, "checked": None, "full_sync_at": meta.get("full_sync_at", 0.0)}
+
+
+def _save_snapshot(table: str, state: Dict[str, Any]) -> None:
+    # Best effort: without a private writable directory (or pyarrow) the snapshot lives in memory only
+    paths = _snapshot_paths(table)
+    if paths is None:
+        return
+    data_path, meta_path = paths
+    frame = state["frame"].copy()
+    for col in frame.columns[frame.dtypes == object]:
+        # Parquet needs one type per column; stringify columns mixing e.g. numbers and text
+        kinds = {type(v) for v in frame[col].dropna()}
+        if len(kinds) > 1:
+            frame[col] = frame[col].map(lambda v: v if v is None or pd.isna(v) else str(v))
+    try:
+        frame.to_parquet(data_path + ".tmp", index=False)
+        os.replace(data_path + ".tmp", data_path)
+        with open(meta_path + ".tmp", "w") as fh:
+            json.dump({"full_sync_at": state["full_sync_at"]}, fh)
+        os.replace(meta_path + ".tmp", meta_path)
+    except (OSError, ValueError, ImportError):
+        pass
+
+
+def _has_integer_id(table: str, frame: pd.DataFrame) -> bool:
+    # Imported here: schema reads the table through init_supabase in this module
+    from schema import has_column
+
+    return has_column(table, "id") and "id" in frame.columns and pd.api.types.is_integer_dtype(frame["id"])
+
+
+def _snapshot_filter(table: str, frame: pd.DataFrame) -> Optional[str]:
+    # Rows changed since the watermark, or inserted after the newest id (updated_at may be unset).
+    # Changed rows are merged by id, so a table without an integer id is downloaded in full (None)
+    if not _has_integer_id(table, frame):
+        return None
+    clauses = []
+    if SNAPSHOT_WATERMARK_COLUMN in frame.columns:
+        # ISO8601: without a format pandas infers one from the first value and drops other precisions
+        watermark = pd.to_datetime(
+            frame[SNAPSHOT_WATERMARK_COLUMN], errors="coerce", utc=True, format="ISO8601",
+        ).max()
+        if not pd.isna(watermark):
+            clauses.append(f'{SNAPSHOT_WATERMARK_COLUMN}.gte."{(watermark - SNAPSHOT_WATERMARK_OVERLAP).isoformat()}"')
+    if frame["id"].notna().any():
+        clauses.append(f"id.gt.{int(frame['id'].max())}")
+    return f"({','.join(clauses)})" if clauses else None
+
+
+def sync_snapshot(
+    table: str, full: bool = False, on_progress: Optional[Callable[[int, int], None]] = None,
+) -> pd.DataFrame:
+    """Bring the local snapshot of ``table`` up to date and return it (raw rows, sorted by id)
+
+    After the first download only rows whose ``updated_at`` moved past the last
+    sync's watermark (or whose id is new) are pulled and merged by ``id``. A sync
+    is skipped while the snapshot is younger than the cache TTL and the table has
+    not been invalidated. Rows deleted upstream disappear at the next full
+    download, forced with ``full`` or every ``SNAPSHOT_FULL_SYNC_SECONDS``.
+    A table without an integer ``id`` is downloaded in full at every sync.
+    """
+    with _snapshot_locks_guard:
+        lock = _snapshot_locks.setdefault(table, threading.Lock())
+    with lock:
+        state = _snapshots.get(table) or _load_snapshot(table)
+        version = _generation(table)
+        if (
+            state is not None
+            and not full
+            and state["version"] == version
+            and time.monotonic() - state["checked"] < CACHE_TTL_SECONDS
+        ):
+            return state["frame"]
+        full = full or state is None or time.time() - state["full_sync_at"] >= SNAPSHOT_FULL_SYNC_SECONDS
+        changed_filter = None if full else _snapshot_filter(table, state["frame"])
+        client = init_supabase()
+        # Imported here: schema reads the table through init_supabase in this module
+        from schema import has_column
+
+        ordered = has_column(table, "id")
+
+        def build_query(count=None):
+            q = client.table(table).select("*", count=count)
+            if changed_filter is not None:
+                q.params = q.params.add("or", changed_filter)
+            return q.order("id") if ordered else q
+
+        changed = _read_pages(build_query, on_progress)
+        if full or changed_filter is None:
+            frame, full_sync_at = changed, time.time()
+        else:
+            frame, full_sync_at = state["frame"], state["full_sync_at"]
+            if not changed.empty:
+                frame = (
+                    pd.concat([frame, changed], ignore_index=True)
+                    .drop_duplicates("id", keep="last")
+                    .sort_values("id", kind="stable")
+                    .reset_index(drop=True)
+                )
+        state = {"frame": frame, "version": version, "checked": time.monotonic(), "full_sync_at": full_sync_at}
+        _snapshots[table] = state
+        if full or not changed.empty:
+            _save_snapshot(table, state)
+        return frame
+
+
+def _query_snapshot(
+    table: str,
+    columns: tuple,
+    date_cols: tuple,
+    start_iso: Optional[str],
+    end_iso: Optional[str],
+    filters: tuple,
+    on_progress: Optional[Callable[[int, int], None]],
+) -> pd.DataFrame:
+    """Answer a ``fetch_table`` query from the local snapshot, matching the server-side filters"""
+    frame = sync_snapshot(table, on_progress=on_progress)
+    if frame.empty:
+        return frame
+    mask = np.ones(len(frame), dtype=bool)
+    for col, value in filters:
+        mask &= (frame[col].isin(value) if isinstance(value, tuple) else frame[col] == value).to_numpy()
+    if date_cols and (start_iso is not None or end_iso is not None):
+        # Bounds without an offset are read as UTC, as Postgres does for timestamptz
+        start = None if start_iso is None else pd.to_datetime(start_iso, utc=True)
+        end = None if end_iso is None else pd.to_datetime(end_iso, utc=True)
+        in_window = np.zeros(len(frame), dtype=bool)
+        for col in date_cols:
+            stamps = pd.to_datetime(frame[col], errors="coerce", utc=True, format="ISO8601")
+            hit = stamps.notna()
+            if start is not None:
+                hit &= stamps >= start
+            if end is not None:
+                hit &= stamps <= end
+            in_window |= hit.to_numpy()
+        mask &= in_window
+    rows = frame.loc[mask] if columns == ("*",) else frame.loc[mask, list(columns)]
+    return rows.reset_index(drop=True)
+
+
+def _empty_frame(table: str, columns: tuple) -> pd.DataFrame:
+    """No rows, but the projected columns (the table's known columns for ``*``), so views need not check for them"""
+    if columns == ("*",):
+        # Imported here: schema reads the table through init_supabase in this module
+        from schema import table_columns
+
+        columns = tuple(sorted(table_columns(table) or ()))
+    return pd.DataFrame({col: pd.Series(dtype=object) for col in columns})
+
+
+@st.cache_data(ttl=CACHE_ENTRY_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _fetch_table_cached(
+    table: str,
+    columns: tuple,
+    date_cols: tuple,
+    start_iso: Optional[str],
+    end_iso: Optional[str],
+    filters: tuple,
+    normalize: bool,
+    version: tuple,
+    _on_progress: Optional[Callable[[int, int], None]] = None,
+) -> pd.DataFrame:
+    if table in SNAPSHOT_TABLES:
+        frame = _query_snapshot(table, columns, date_cols, start_iso, end_iso, filters, _on_progress)
+    else:
+        client = init_supabase()
+
+        def build_query(count=None):
+            q = client.table(table).select(*columns, count=count)
+            for col, value in filters:
+                q = q.in_(col, list(value)) if isinstance(value, tuple) else q.eq(col, value)
+            if len(date_cols) == 1:
+                if start_iso is not None:
+                    q = q.gte(date_cols[0], start_iso)
+                if end_iso is not None:
+                    q = q.lte(date_cols[0], end_iso)
+            elif date_cols and (start_iso is not None or end_iso is not None):
+                # Keep rows inside the window on any of the columns: one PostgREST or=() filter
+                # (postgrest-py 0.10 has no or_() builder method, so the param is added directly)
+                q.params = q.params.add("or", f"({','.join(_window_clause(col, start_iso, end_iso) for col in date_cols)})")
+            return q.order("id")
+
+        frame = _read_pages(build_query, _on_progress)
+    if frame.empty:
+        frame = _empty_frame(table, columns)
+    # Normalize and classify once here so every reader of the cached frame gets typed columns
+    return _add_status_flags(table, _normalize(frame)) if normalize else frame
+
+
+def _filters_key(filters: Optional[Dict[str, Any]]) -> tuple:
+    # Hashable, order-independent form of a filters dict (lists become tuples)
+    return tuple(sorted(
+        (col, tuple(value) if isinstance(value, (list, tuple)) else value)
+        for col, value in (filters or {}).items()
+    ))
+
+
+def fetch_table(
+    table: str,
+    columns: Union[str, Sequence[str]] = "*",
+    date_col: Optional[Union[str, Sequence[str]]] = None,
+    start: Optional[Union[pd.Timestamp, str]] = None,
+    end: Optional[Union[pd.Timestamp, str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    normalize: bool = True,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> pd.DataFrame:
+    """Fetch a table as a DataFrame, cached by table, column projection, filters and date window
+
+    ``date_col``/``start``/``end`` restrict rows server-side; pass ``None`` for an
+    unbounded side of the window. With several date columns a row is kept when
+    any of them falls inside the window, so one frame can serve views that filter
+    on different columns (each view still applies its own mask). ``filters`` maps
+    a column to a value (equality) or a list of values (membership); values are
+    matched server-side, before normalization. With ``normalize`` the columns
+    named in ``LABEL_COLUMNS``/``STATUS_COLUMNS``/``TIMESTAMP_COLUMNS``/
+    ``BOOL_COLUMNS`` are converted once at load and status flags are added
+    (see ``_add_status_flags``; pass False to show raw rows).
+    Results larger than the server's row cap are read in concurrent ``range``
+    pages; tables in ``SNAPSHOT_TABLES`` are filtered locally after an
+    incremental sync. ``on_progress(rows_fetched, total_rows)`` is called as
+    pages arrive (not on cache hits). An empty result still has the projected
+    columns (``*`` is resolved with ``schema.table_columns``). When the current
+    result is not cached yet or cannot be fetched, the last good one may be
+    returned while a fresh one loads (see ``resilience.serve``). The returned
+    frame is a private copy.
+    """
+    if isinstance(columns, str):
+        columns = [columns]
+    if date_col is None:
+        date_cols = ()
+    elif isinstance(date_col, str):
+        date_cols = (date_col,)
+    else:
+        date_cols = tuple(date_col)
+    args = (table, tuple(columns), date_cols, to_iso(start), to_iso(end), _filters_key(filters), normalize)
+    return serve(
+        # Keyed without the bucketed end, which goes in the version instead
+        ("fetch_table",) + args[:4] + (window_key(args[4]),) + args[5:],
+        table,
+        [table],
+        cache_version(table) + (args[4],),
+        lambda version: _fetch_table_cached(*args, version, _on_progress=on_progress),
+        # Background refreshes run off the script thread, where a progress bar cannot be updated
+        refresh=lambda version: _fetch_table_cached(*args, version),
+    )
+
+
+def _memoized_per_render(key: tuple, compute: Callable[[], Any]) -> Any:
+    # The first caller of a key in a render computes it; concurrent and later callers wait for its result
+    scope = render_scope()
+    if scope is None:
+        return compute()
+    session_id, render_no = scope
+    with _count_memos_lock:
+        memo = _count_memos.get(session_id)
+        if memo is None or memo[0] != render_no:
+            memo = _count_memos[session_id] = (render_no, {})
+        _count_memos.move_to_end(session_id)
+        while len(_count_memos) > MAX_TRACKED_SESSIONS:
+            _count_memos.popitem(last=False)
+        future = memo[1].get(key)
+        owner = future is None
+        if owner:
+            future = memo[1][key] = Future()
+    record_memo(hit=not owner)
+    if owner:
+        try:
+            future.set_result(compute())
+        except Exception as err:
+            future.set_exception(err)
+    return future.result()
+
+
+def count_mode(start: Optional[Union[pd.Timestamp, str]], end: Optional[Union[pd.Timestamp, str]]) -> str:
+    """PostgREST count method for a date window: "exact" up to ``EXACT_COUNT_MAX_DAYS``, else ``WIDE_COUNT_MODE``
+
+    Exact counts scan every matching row, which is slow on large tables over
+    "All time"; wide windows trade precision for a planner estimate.
+    """
+    if start is None or end is None:
+        return WIDE_COUNT_MODE
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    return "exact" if span <= pd.Timedelta(days=EXACT_COUNT_MAX_DAYS) else WIDE_COUNT_MODE
+
+
+def count_rows(
+    table: str,
+    filters: Optional[Dict[str, Any]] = None,
+    date_col: Optional[str] = None,
+    start: Optional[Union[pd.Timestamp, str]] = None,
+    end: Optional[Union[pd.Timestamp, str]] = None,
+    not_null: Optional[str] = None,
+    count: str = "exact",
+) -> int:
+    """Number of ``table`` rows matching ``filters``, the ``date_col`` window and ``not_null``
+
+    ``filters`` maps a column to a value (equality) or a list of values
+    (membership), as in ``fetch_table``; ``None`` bounds leave that side of the
+    window open. ``count`` is the PostgREST count method ("exact", "planned" or
+    "estimated"; see ``count_mode``). The request asks for ``limit=0`` with
+    ``Prefer: count=<method>``, so only the ``Content-Range`` total comes back
+    (an empty JSON array as the body), whatever the table size. Identical counts
+    within one render are requested once, keyed on the normalized query and
+    method; hits and misses show in the query timings panel.
+    """
+    start_iso, end_iso = to_iso(start), to_iso(end)
+    filters_key = _filters_key(filters)
+    window = (date_col, start_iso, end_iso) if date_col and (start_iso is not None or end_iso is not None) else None
+
+    def request() -> int:
+        # Not a HEAD request: postgrest-py 0.10.8 reads a HEAD response's empty body as count 0
+        q = init_supabase().table(table).select("id", count=count).limit(0)
+        for col, value in filters_key:
+            q = q.in_(col, list(value)) if isinstance(value, tuple) else q.eq(col, value)
+        if not_null:
+            q = q.not_.is_(not_null, "null")
+        if window is not None:
+            if start_iso is not None:
+                q = q.gte(date_col, start_iso)
+            if end_iso is not None:
+                q = q.lte(date_col, end_iso)
+        return int(q.execute().count or 0)
+
+    return _memoized_per_render((table, filters_key, not_null, window, count), request)
+
+
+def count_many(specs: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Several ``count_rows`` at once, keyed like ``specs`` (each value holds ``count_rows`` keyword arguments)
+
+    The counts are sent together over the shared query pool, so the batch takes
+    about as long as its slowest count; duplicates within the batch or earlier in
+    the render reuse the memoized result. Each key holds its count, or the
+    exception its request raised. Call from the script thread, not a pool task.
+    """
+    return run_concurrently({key: (lambda spec=spec: count_rows(**spec)) for key, spec in specs.items()})
+
+
+def fetch_table_with_progress(label: str, table: str, **kwargs) -> pd.DataFrame:
+    """``fetch_table`` that shows a progress bar while a large result downloads"""
+    bar = st.progress(0.0, text=label)
+
+    def report(fetched: int, total: int) -> None:
+        bar.progress(fetched / total, text=f"{label} ({fetched:,} / {total:,} rows)")
+
+    try:
+        return fetch_table(table, on_progress=report, **kwargs)
+    finally:
+        bar.empty()
+
+
+def invalidate(table: Optional[str] = None) -> None:
+    """Drop cached data for one table, or for every table when ``table`` is None"""
+    global _cache_epoch
+    # Also drop last good results, so the next read waits for current data instead of serving them
+    forget(None if table is None else [table])
+    if table is None:
+        _cache_epoch += 1
+        _fetch_table_cached.clear()
+        return
+    _table_versions[table] = _table_versions.get(table, 0) + 1
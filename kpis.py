@@ -0,0 +1,186 @@
+"""
+KPI engine for the nine top-row KPI cards.
+
+Every current and previous-period count comes from the ``dashboard_kpis`` RPC
+(see dashboard_kpis.sql) in one round trip. Wide windows ("All time", long
+custom ranges), installs without the function and walkin tables without its
+Walkin Won column (``KPI_RPC_WON_COL``) instead send the counts as
+one concurrent batch of count-only requests (``data_access.count_many``),
+estimated rather than exact for wide windows, each distinct count once per
+render so shared denominators are not fetched again.
+"""
+
+from typing import Dict, Optional
+
+import pandas as pd
+import streamlit as st
+
+from data_access import (
+    CACHE_ENTRY_TTL_SECONDS, CACHE_MAX_ENTRIES, cache_version, count_many, count_mode, init_supabase, to_iso,
+    window_key,
+)
+from resilience import serve
+from schema import first_column
+
+KPI_RPC = "dashboard_kpis"
+KPI_TABLES = ("lead_master", "walkin_table", "ps_followup_master")
+# Candidate date columns of the Walkin Won card, in priority order (see schema.first_column)
+WALKIN_WON_DATE_COLS = ["won_timestamp", "updated_at", "created_at"]
+# Walkin Won date column the dashboard_kpis function is written against
+KPI_RPC_WON_COL = "won_timestamp"
+# PostgREST / Postgres error codes meaning the RPC does not exist
+_MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+
+# Flipped off once Supabase reports the RPC is missing, so later renders skip it
+_rpc_available = True
+
+# (key, table, date column, equality filters, not-null column) per distinct count
+_COUNT_SPECS = [
+    ("leads", "lead_master", "created_at", {}, None),
+    ("assigned_cre", "lead_master", "created_at", {}, "cre_name"),
+    ("assigned_ps", "lead_master", "ps_assigned_at", {}, "ps_name"),
+    ("pending", "lead_master", "created_at", {"final_status": "Pending"}, None),
+    ("lost", "lead_master", "created_at", {"final_status": "Lost"}, None),
+    ("won", "lead_master", "created_at", {"final_status": "Won"}, None),
+    ("walkin", "walkin_table", "created_at", {}, None),
+    ("td_walkin", "walkin_table", "updated_at", {"test_drive_done": True}, None),
+    ("td_ps", "ps_followup_master", "updated_at", {"test_drive_done": True}, None),
+]
+
+
+def pct_delta(curr: int, prev: Optional[int]) -> str:
+    """Delta label for a KPI card: percent change vs the previous period, or — without one"""
+    if prev is None:
+        return "—"
+    if prev == 0:
+        return "+∞%" if curr > 0 else "0%"
+    pct_change = (curr - prev) / prev * 100.0
+    return f"{pct_change:+.1f}%"
+
+
+def _count_spec(
+    table: str, date_col: Optional[str], start_iso: Optional[str], end_iso: Optional[str], eq: Dict, not_null: Optional[str], mode: str,
+) -> Dict:
+    # ``count_rows`` arguments; the window applies only when both bounds are set, so identical
+    # counts (e.g. the walkin total and the unbounded Walkin Won base) share one request per render
+    bounded = bool(date_col) and start_iso is not None and end_iso is not None
+    return {
+        "table": table, "filters": eq, "date_col": date_col if bounded else None,
+        "start": start_iso, "end": end_iso, "not_null": not_null, "count": mode,
+    }
+
+
+def _kpis_from_rpc(start_iso, end_iso, prev_start_iso, prev_end_iso) -> Dict:
+    res = init_supabase().rpc(
+        KPI_RPC,
+        {"p_start": start_iso, "p_end": end_iso, "p_prev_start": prev_start_iso, "p_prev_end": prev_end_iso},
+    ).execute()
+    row = res.data[0] if isinstance(res.data, list) else res.data
+    kpis = {k: int(v or 0) for k, v in row.items()}
+    if prev_start_iso is None or prev_end_iso is None:
+        for k in list(kpis):
+            if k.endswith("_prev"):
+                kpis[k] = None
+    return kpis
+
+
+def _kpis_from_counts(start_iso, end_iso, prev_start_iso, prev_end_iso, mode: str) -> Dict:
+    kpis: Dict = {}
+    errors: Dict[str, str] = {}
+    has_prev = prev_start_iso is not None and prev_end_iso is not None
+    windows = [("", start_iso, end_iso)]
+    if has_prev:
+        windows.append(("_prev", prev_start_iso, prev_end_iso))
+    # Walkin Won is dated by the first of its candidate columns the table has
+    won_col = first_column("walkin_table", WALKIN_WON_DATE_COLS)
+    specs: Dict[str, Dict] = {}
+    for suffix, w_start, w_end in windows:
+        for key, table, date_col, eq, not_null in _COUNT_SPECS:
+            specs[key + suffix] = _count_spec(table, date_col, w_start, w_end, eq, not_null, mode)
+        specs["walkin_won" + suffix] = _count_spec("walkin_table", won_col, w_start, w_end, {"status": "Won"}, None, mode)
+    specs["walkin_won_base"] = _count_spec("walkin_table", won_col, start_iso, end_iso, {}, None, mode)
+    counts = count_many(specs)
+    failed = [value for value in counts.values() if isinstance(value, Exception)]
+    if len(failed) == len(counts):
+        # Nothing loaded (e.g. Supabase is down): raise so the failure is not cached
+        raise failed[0]
+    for key, value in counts.items():
+        if not isinstance(value, Exception):
+            kpis[key] = value
+        elif key.startswith("walkin_won"):
+            kpis[key] = 0
+            if key != "walkin_won_base":
+                errors[key] = str(value)
+        else:
+            kpis[key] = None
+            errors[key] = str(value)
+    if not has_prev:
+        for key, *_ in _COUNT_SPECS:
+            kpis[key + "_prev"] = None
+        kpis["walkin_won_prev"] = None
+    kpis["errors"] = errors
+    kpis["count_mode"] = mode
+    return kpis
+
+
+@st.cache_data(ttl=CACHE_ENTRY_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _fetch_kpis_cached(start_iso, end_iso, prev_start_iso, prev_end_iso, version: tuple) -> Dict:
+    global _rpc_available
+    # The RPC counts exactly; wide windows skip it for planner-estimated counts, and it dates
+    # Walkin Won by KPI_RPC_WON_COL, so it is skipped where the schema resolves another column
+    mode = count_mode(start_iso, end_iso)
+    if _rpc_available and mode == "exact" and first_column("walkin_table", WALKIN_WON_DATE_COLS) == KPI_RPC_WON_COL:
+        try:
+            kpis = _kpis_from_rpc(start_iso, end_iso, prev_start_iso, prev_end_iso)
+            kpis["errors"] = {}
+            kpis["count_mode"] = mode
+            return kpis
+        except Exception as err:
+            if getattr(err, "code", None) in _MISSING_FUNCTION_CODES:
+                _rpc_available = False
+    return _kpis_from_counts(start_iso, end_iso, prev_start_iso, prev_end_iso, mode)
+
+
+def fetch_kpis(
+    start: Optional[pd.Timestamp],
+    end: Optional[pd.Timestamp],
+    prev_start: Optional[pd.Timestamp],
+    prev_end: Optional[pd.Timestamp],
+) -> Dict:
+    """All KPI counts for the current window and the previous comparison period
+
+    Keys mirror the ``dashboard_kpis`` columns (``leads``, ``leads_prev``, ...);
+    ``*_prev`` values are None when there is no previous period, ``errors``
+    maps any count that could not be loaded to its error message and
+    ``count_mode`` is the count method used (see ``data_access.count_mode``):
+    "exact" for windows up to ``EXACT_COUNT_MAX_DAYS``, estimated beyond.
+    While current counts are unavailable the last good ones may be returned
+    (see ``resilience.serve``); never raises.
+    """
+    args = (to_iso(start), to_iso(end), to_iso(prev_start), to_iso(prev_end))
+    try:
+        return serve(
+            # Keyed without the bucketed end, which goes in the version instead
+            ("kpis", args[0], window_key(args[1])) + args[2:], "KPIs", KPI_TABLES,
+            cache_version(*KPI_TABLES) + (args[1],),
+            lambda version: _fetch_kpis_cached(*args, version),
+        )
+    except Exception as err:
+        return _failed_kpis(args[0], args[1], err)
+
+
+def _failed_kpis(start_iso: Optional[str], end_iso: Optional[str], err: Exception) -> Dict:
+    # Every card reports ``err``, as when each count failed on its own
+    keys = [key + suffix for suffix in ("", "_prev") for key in [spec[0] for spec in _COUNT_SPECS] + ["walkin_won"]]
+    kpis: Dict = {key: 0 if key.startswith("walkin_won") else None for key in keys}
+    kpis["walkin_won_base"] = 0
+    kpis["errors"] = {key: str(err) for key in keys}
+    kpis["count_mode"] = count_mode(start_iso, end_iso)
+    return kpis
+
+
+def kpi_value(kpis: Dict, key: str) -> Optional[int]:
+    """Look up one KPI count, re-raising the recorded error if it failed to load"""
+    if key in kpis.get("errors", {}):
+        raise RuntimeError(kpis["errors"][key])
+    return kpis.get(key)
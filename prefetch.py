@@ -0,0 +1,168 @@
+"""
+Date windows and per-tab fetches of the dashboard, and a background cache warmer.
+
+``filter_window`` and ``tab_fetches`` are what app.py renders from, so the warmer
+builds exactly the cache keys an interactive load looks up. The warmer thread
+(started once per process by ``start_warmer``) recomputes the KPI row and every
+tab's tables for ``WARM_FILTERS`` shortly before each cache bucket begins, so
+loads with one of those filters are answered from cache. Fetches it could not
+warm are logged as warnings on the ``dashboard.prefetch`` logger.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from data_access import CACHE_TTL_SECONDS, current_date, fetch_table, now_bucket, pinned_bucket
+from kpis import fetch_kpis
+from resilience import fresh
+from rollups import fetch_lead_rollup
+
+# Date filters kept warm in the background (empty disables the warmer)
+WARM_FILTERS = tuple(
+    f.strip() for f in os.getenv("DASHBOARD_WARM_FILTERS", "MTD,Today,All time").split(",") if f.strip()
+)
+# Seconds before a bucket starts that the warmer begins filling its cache keys
+WARM_LEAD_SECONDS = int(os.getenv("DASHBOARD_WARM_LEAD", "60"))
+
+# walkin_table views filter on created_at (Punched, Pending, TD) and updated_at (Won/Lost)
+WALKIN_DATE_COLUMNS = ["created_at", "updated_at"]
+
+Window = Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp], Optional[pd.Timestamp], Optional[pd.Timestamp]]
+
+logger = logging.getLogger("dashboard.prefetch")
+
+
+def filter_window(option: str, custom_start: Optional[date] = None, custom_end: Optional[date] = None) -> Window:
+    """``(start, end, prev_start, prev_end)`` in UTC for a global date filter option
+
+    "now" is bucketed so open-ended windows share cache keys; "All time" and a
+    missing previous period are ``None``. ``custom_*`` are the Custom Range dates.
+    """
+    today = current_date()
+    today_start = pd.Timestamp(today).tz_localize("UTC")
+    today_end = today_start + pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
+    month_start = pd.Timestamp(today.replace(day=1)).tz_localize("UTC")
+
+    if option == "Today":
+        start, end = today_start, today_end
+    elif option == "MTD":
+        start, end = month_start, now_bucket()
+    elif option == "Custom Range":
+        start = pd.Timestamp(custom_start).tz_localize("UTC")
+        end = pd.Timestamp(custom_end).tz_localize("UTC") + pd.Timedelta(days=1) - pd.Timedelta(milliseconds=1)
+    else:
+        start, end = None, None
+
+    # Previous period for delta comparison
+    prev_start, prev_end = None, None
+    if option == "MTD":
+        prev_start = month_start - pd.offsets.MonthBegin(1)
+        prev_end = month_start - pd.Timedelta(milliseconds=1)
+    elif option == "Today":
+        prev_start = today_start - pd.Timedelta(days=1)
+        prev_end = today_end - pd.Timedelta(days=1)
+    elif option == "Custom Range":
+        duration = end - start + pd.Timedelta(milliseconds=1)
+        prev_end = start - pd.Timedelta(milliseconds=1)
+        prev_start = prev_end - duration + pd.Timedelta(milliseconds=1)
+    return start, end, prev_start, prev_end
+
+
+def tab_fetches(start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> Dict[str, Dict[str, Callable[[], Any]]]:
+    """Independent fetches each dashboard tab needs for the window, keyed by tab then by name
+
+    Frames read with more than one date column keep rows inside the window on any
+    of them; each view still masks on its own column. ``None`` bounds leave the
+    fetch unfiltered.
+    """
+    def walkin():
+        return fetch_table("walkin_table", date_col=WALKIN_DATE_COLUMNS, start=start, end=end)
+
+    return {
+        "overall": {
+            "walkin": walkin,
+            "walkin_open": lambda: fetch_table("walkin_table", ["ps_assigned"], filters={"status": "Pending"}),
+            "lead_rollup": lambda: fetch_lead_rollup(start, end),
+            "ps_overall": lambda: fetch_table(
+                "ps_followup_master", ["ps_branch", "ps_assigned_at", "final_status", "lead_status", "first_call_date", "ps_name"],
+                date_col="ps_assigned_at", start=start, end=end,
+            ),
+            "pfm_open": lambda: fetch_table("ps_followup_master", ["ps_name", "first_call_date"], filters={"final_status": "Pending"}),
+            "pfm_closed": lambda: fetch_table(
+                "ps_followup_master", ["ps_name", "final_status"],
+                date_col="won_timestamp", start=start, end=end, filters={"final_status": ["Won", "Lost"]},
+            ),
+            "act_open": lambda: fetch_table("activity_leads", ["ps_name", "ps_first_call_date"], filters={"final_status": "Pending"}),
+            "act_closed": lambda: fetch_table(
+                "activity_leads", ["ps_name", "final_status"],
+                date_col="created_at", start=start, end=end, filters={"final_status": ["Won", "Lost"]},
+            ),
+        },
+        "branch": {
+            "walkin": walkin,
+            "ps_assignments": lambda: fetch_table(
+                "ps_followup_master", ["ps_name", "ps_branch", "ps_assigned_at"],
+                date_col="ps_assigned_at", start=start, end=end,
+            ),
+            "ps_followup_window": lambda: fetch_table(
+                "ps_followup_master",
+                ["ps_name", "ps_branch", "final_status", "lead_status", "first_call_date", "lead_category"],
+                date_col="ps_assigned_at", start=start, end=end,
+            ),
+        },
+        "cre": {
+            "lead_rollup": lambda: fetch_lead_rollup(start, end),
+        },
+    }
+
+
+def warm(option: str) -> Dict[str, str]:
+    """Load the KPI row and every tab's fetches for ``option`` into the cache
+
+    Runs on the calling thread, one fetch at a time, so a pinned bucket applies
+    and the shared query pool stays free for interactive renders. Fetches wait
+    for current results rather than returning stale ones. Returns the error
+    message of each fetch that failed.
+    """
+    start, end, prev_start, prev_end = filter_window(option)
+    tasks: Dict[str, Callable[[], Any]] = {"kpis": lambda: fetch_kpis(start, end, prev_start, prev_end)}
+    for tab, fetches in tab_fetches(start, end).items():
+        tasks.update({f"{tab}.{name}": fn for name, fn in fetches.items()})
+    errors: Dict[str, str] = {}
+    with fresh():
+        for key, fn in tasks.items():
+            try:
+                fn()
+            except Exception as err:
+                errors[key] = str(err)
+    return errors
+
+
+def _warm_forever() -> None:
+    bucket = now_bucket()
+    while True:
+        with pinned_bucket(bucket):
+            for option in WARM_FILTERS:
+                for key, message in warm(option).items():
+                    logger.warning("Cache warm-up (%s) failed for %s: %s", option, key, message)
+        # Bucket ``b`` is current from b - TTL; fill it WARM_LEAD_SECONDS before that
+        bucket = max(bucket + pd.Timedelta(seconds=CACHE_TTL_SECONDS), now_bucket())
+        starts_at = bucket - pd.Timedelta(seconds=CACHE_TTL_SECONDS + WARM_LEAD_SECONDS)
+        time.sleep(max(0.0, (starts_at - pd.Timestamp.now(tz="UTC")).total_seconds()))
+
+
+@st.cache_resource
+def start_warmer() -> Optional[threading.Thread]:
+    """Start the background cache warmer once per process (no-op without ``WARM_FILTERS``)"""
+    if not WARM_FILTERS:
+        return None
+    thread = threading.Thread(target=_warm_forever, name="cache-warmer", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,60 @@
+"""
+Concurrent execution of independent Supabase queries.
+
+PostgREST requests are network bound, so independent fetches for a render are
+dispatched together over one bounded, process-wide thread pool and the render
+waits only as long as the slowest of them.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Upper bound on simultaneous Supabase requests per process
+MAX_QUERY_WORKERS = int(os.getenv("DASHBOARD_QUERY_WORKERS", "8"))
+
+
+@st.cache_resource
+def _get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=MAX_QUERY_WORKERS, thread_name_prefix="supabase-query")
+
+
+def with_script_ctx(fn: Callable[[], Any], ctx) -> Callable[[], Any]:
+    """Wrap ``fn`` to run under the script context ``ctx`` on whichever pool thread picks it up"""
+    # Pool threads are shared between sessions, so attach the caller's context per task
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+    return run
+
+
+def run_concurrently(tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """Run independent zero-argument callables on the shared pool and wait for all of them
+
+    Returns a dict with the same keys holding each task's result, or the exception
+    it raised so callers can report failures per section. Tasks must not submit
+    further work to the pool themselves.
+    """
+    # None off the script thread (e.g. the cache warmer); tasks then run without a session
+    ctx = get_script_run_ctx(suppress_warning=True)
+    executor = _get_executor()
+    futures = {key: executor.submit(with_script_ctx(fn, ctx)) for key, fn in tasks.items()}
+    results: Dict[str, Any] = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as err:
+            results[key] = err
+    return results
+
+
+def unwrap(results: Dict[str, Any], key: str) -> Any:
+    """Result of one task from ``run_concurrently``, re-raising its exception if it failed"""
+    value = results[key]
+    if isinstance(value, Exception):
+        raise value
+    return value
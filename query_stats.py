@@ -0,0 +1,279 @@
+"""
+Instrumentation of the Supabase (PostgREST) requests the dashboard makes.
+
+``instrument`` hooks the client's HTTP session, so every query builder's
+``.execute()`` (table selects, count-only queries, RPCs) is recorded with its table,
+filters, row count, payload size and latency. Each record is logged as one JSON
+line and aggregated per render, per session and per process for the admin
+timing panel (``render_timing_panel``). Requests made outside a session, such as
+the cache warmer's, only count towards the process totals.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Level of the per-request JSON log lines (WARNING or above silences them)
+QUERY_LOG_LEVEL = os.getenv("DASHBOARD_QUERY_LOG_LEVEL", "INFO").upper()
+# Sessions whose statistics are kept per process (least recently active dropped first)
+MAX_TRACKED_SESSIONS = 256
+# Query parameters that shape the response rather than filter rows
+_SHAPE_PARAMS = ("select", "order", "limit", "offset")
+# Request extension holding the perf_counter value the request was sent at
+_STARTED = "dashboard_started"
+
+logger = logging.getLogger("dashboard.queries")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(QUERY_LOG_LEVEL)
+    logger.propagate = False
+
+# Per session: records of the current and last completed render, render wall times and table totals
+_sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Table totals over every request of the process, sessions and background work alike
+_process_totals: Dict[str, Dict[str, float]] = {}
+_lock = threading.Lock()
+# Set while a fragment-only rerun is being collected, so nested fragments join it
+_fragment_state = threading.local()
+
+
+def _new_session() -> Dict[str, Any]:
+    return {
+        "render_no": 0, "render": [], "last_render": [], "render_started": None, "last_render_seconds": None,
+        "memo": {"hits": 0, "misses": 0}, "last_render_memo": {"hits": 0, "misses": 0},
+        "stale": {}, "totals": {},
+    }
+
+
+def _session_state(session_id: str) -> Dict[str, Any]:
+    # Caller holds _lock
+    state = _sessions.get(session_id)
+    if state is None:
+        state = _sessions[session_id] = _new_session()
+    _sessions.move_to_end(session_id)
+    while len(_sessions) > MAX_TRACKED_SESSIONS:
+        _sessions.popitem(last=False)
+    return state
+
+
+def _session_id() -> Optional[str]:
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return None if ctx is None else ctx.session_id
+
+
+def _add_to_totals(totals: Dict[str, Dict[str, float]], entry: Dict[str, Any]) -> None:
+    table = totals.setdefault(entry["table"], {"calls": 0, "rows": 0, "bytes": 0, "seconds": 0.0, "max_seconds": 0.0})
+    table["calls"] += 1
+    table["rows"] += entry["rows"] or 0
+    table["bytes"] += entry["bytes"]
+    table["seconds"] += entry["seconds"]
+    table["max_seconds"] = max(table["max_seconds"], entry["seconds"])
+
+
+def _returned_rows(response: httpx.Response) -> Optional[int]:
+    # PostgREST reports the returned slice as "first-last/total" ("*/total" when empty)
+    content_range = response.headers.get("content-range")
+    if not content_range:
+        return None
+    returned = content_range.split("/")[0]
+    if returned == "*":
+        return 0
+    first, _, last = returned.partition("-")
+    try:
+        return int(last) - int(first) + 1
+    except ValueError:
+        return None
+
+
+def record(entry: Dict[str, Any]) -> None:
+    """Log one request and add it to the current session's render and the process totals"""
+    session_id = _session_id()
+    logger.info(json.dumps({"event": "supabase_request", "session": session_id, **entry}, default=str))
+    with _lock:
+        _add_to_totals(_process_totals, entry)
+        if session_id is None:
+            return
+        state = _session_state(session_id)
+        state["render"].append(entry)
+        _add_to_totals(state["totals"], entry)
+
+
+def instrument(client) -> None:
+    """Record every request ``client`` (a supabase Client) sends to PostgREST"""
+    session: httpx.Client = client.postgrest.session
+    base_path = session.base_url.path.rstrip("/")
+
+    def on_request(request: httpx.Request) -> None:
+        request.extensions[_STARTED] = time.perf_counter()
+
+    def on_response(response: httpx.Response) -> None:
+        # Read the body here so the latency covers the full download
+        response.read()
+        request = response.request
+        path = request.url.path
+        if path.startswith(base_path):
+            path = path[len(base_path):]
+        record({
+            "table": path.lstrip("/") or "/",
+            "method": request.method,
+            "filters": "&".join(f"{k}={v}" for k, v in request.url.params.multi_items() if k not in _SHAPE_PARAMS),
+            "range": request.headers.get("range"),
+            "status": response.status_code,
+            "rows": _returned_rows(response),
+            "bytes": len(response.content),
+            "seconds": time.perf_counter() - request.extensions.get(_STARTED, time.perf_counter()),
+        })
+
+    hooks = session.event_hooks
+    hooks["request"].append(on_request)
+    hooks["response"].append(on_response)
+    session.event_hooks = hooks
+
+
+def begin_render() -> None:
+    """Close the session's previous render and start collecting a new one (call at the top of the script)"""
+    session_id = _session_id()
+    if session_id is None:
+        return
+    with _lock:
+        state = _session_state(session_id)
+        state["render_no"] += 1
+        state["last_render"], state["render"] = state["render"], []
+        state["last_render_memo"], state["memo"] = state["memo"], {"hits": 0, "misses": 0}
+        state["stale"] = {}
+        state["render_started"] = time.perf_counter()
+
+
+def render_scope() -> Optional[Tuple[str, int]]:
+    """``(session id, render number)`` of the calling script run; None outside a session"""
+    session_id = _session_id()
+    if session_id is None:
+        return None
+    with _lock:
+        return session_id, _session_state(session_id)["render_no"]
+
+
+def record_memo(hit: bool) -> None:
+    """Count one lookup in a per-render request memo (see ``data_access.count_rows``)"""
+    session_id = _session_id()
+    if session_id is None:
+        return
+    with _lock:
+        _session_state(session_id)["memo"]["hits" if hit else "misses"] += 1
+
+
+def record_stale(label: str, age_seconds: float) -> None:
+    """Note that this render showed stale data for ``label`` (see ``resilience.serve``); the oldest age is kept"""
+    session_id = _session_id()
+    if session_id is None:
+        return
+    with _lock:
+        stale = _session_state(session_id)["stale"]
+        stale[label] = max(stale.get(label, 0.0), age_seconds)
+
+
+def stale_reads() -> Dict[str, float]:
+    """Age in seconds of each stale result the current render showed, by label"""
+    session_id = _session_id()
+    if session_id is None:
+        return {}
+    with _lock:
+        state = _sessions.get(session_id)
+        return dict(state["stale"]) if state else {}
+
+
+def end_render() -> None:
+    """Stamp the wall time of the render started by ``begin_render`` (call at the end of the script)"""
+    session_id = _session_id()
+    with _lock:
+        state = _sessions.get(session_id) if session_id is not None else None
+        if state is not None and state["render_started"] is not None:
+            state["last_render_seconds"] = time.perf_counter() - state["render_started"]
+
+
+@contextmanager
+def fragment_render() -> Iterator[bool]:
+    """Collect a rerun of just the enclosing ``st.fragment`` as a render of its own (wrap the fragment body)
+
+    Fragment reruns skip the top of the script, so ``begin_render``/``end_render``
+    are called around the body instead: the per-render request memo, the timing
+    panel and stale reads then cover that rerun. On a full run, and in fragments
+    nested in one already collected, the body belongs to the enclosing render
+    and nothing is done. Yields whether a render was started.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None or not ctx.fragment_ids_this_run or getattr(_fragment_state, "active", False):
+        yield False
+        return
+    _fragment_state.active = True
+    begin_render()
+    try:
+        yield True
+    finally:
+        end_render()
+        _fragment_state.active = False
+
+
+def _totals_frame(totals: Dict[str, Dict[str, float]]) -> pd.DataFrame:
+    frame = pd.DataFrame.from_dict(totals, orient="index")
+    if frame.empty:
+        return frame
+    frame["avg_ms"] = frame["seconds"] / frame["calls"] * 1000
+    frame["total_ms"] = frame["seconds"] * 1000
+    frame["max_ms"] = frame["max_seconds"] * 1000
+    frame["kb"] = frame["bytes"] / 1024
+    return (
+        frame.rename_axis("table")
+        .reset_index()[["table", "calls", "rows", "kb", "total_ms", "avg_ms", "max_ms"]]
+        .sort_values("total_ms", ascending=False)
+        .round(1)
+        .reset_index(drop=True)
+    )
+
+
+def render_timing_panel() -> None:
+    """Sidebar expander with the last render's Supabase requests and session/process totals (admin only)"""
+    session_id = _session_id()
+    with _lock:
+        state = _sessions.get(session_id) if session_id is not None else None
+        last_render: List[Dict[str, Any]] = list(state["last_render"]) if state else []
+        render_seconds = state["last_render_seconds"] if state else None
+        memo = dict(state["last_render_memo"]) if state else {"hits": 0, "misses": 0}
+        session_totals = {k: dict(v) for k, v in state["totals"].items()} if state else {}
+        process_totals = {k: dict(v) for k, v in _process_totals.items()}
+
+    with st.expander("⏱️ Query timings"):
+        st.caption("Previous render (cache hits make no requests)")
+        if last_render:
+            calls = pd.DataFrame(last_render)
+            query_seconds = calls["seconds"].sum()
+            summary = f"{len(calls)} requests, {query_seconds * 1000:,.0f} ms query time, {calls['bytes'].sum() / 1024:,.0f} KB"
+            if render_seconds is not None:
+                summary = f"Render {render_seconds * 1000:,.0f} ms; " + summary
+            st.write(summary)
+            if memo["hits"] or memo["misses"]:
+                st.write(f"Count memo: {memo['hits']} hits, {memo['misses']} misses")
+            calls["ms"] = (calls["seconds"] * 1000).round(1)
+            calls["kb"] = (calls["bytes"] / 1024).round(1)
+            st.dataframe(
+                calls.sort_values("ms", ascending=False)[["table", "ms", "rows", "kb", "status", "filters", "range"]],
+                hide_index=True,
+            )
+        else:
+            st.write("No Supabase requests")
+        st.caption("This session, per table")
+        st.dataframe(_totals_frame(session_totals), hide_index=True)
+        st.caption("All sessions and background work since the process started, per table")
+        st.dataframe(_totals_frame(process_totals), hide_index=True)
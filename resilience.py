@@ -0,0 +1,264 @@
+"""
+Stale-while-revalidate reads and a circuit breaker around Supabase.
+
+``serve`` sits in front of the cached fetches (``data_access.fetch_table``,
+``kpis.fetch_kpis``). It keeps the last good result of each query: when the
+cache key has rolled over (a new bucket) that result is returned immediately,
+marked stale with its age, while a background thread computes the new one. A
+failed fetch also falls back to it. Only a query never answered before waits
+for Supabase.
+
+``BreakerTransport`` wraps the Supabase client's HTTP transport (see
+supabase_client.py). After ``BREAKER_FAILURES`` consecutive failed requests
+(timeouts, connection errors, 429 and 5xx responses) the circuit opens and
+requests fail at once with ``CircuitOpenError`` for ``BREAKER_COOLDOWN_SECONDS``;
+then one probe request is let through and its outcome closes or reopens it.
+``render_stale_notice`` tells the user when a render showed stale data.
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, Optional, Tuple
+
+import httpx
+import pandas as pd
+import streamlit as st
+
+from query_stats import record_stale, stale_reads
+
+# Consecutive failed requests that open the circuit
+BREAKER_FAILURES = int(os.getenv("DASHBOARD_BREAKER_FAILURES", "5"))
+# Seconds an open circuit rejects requests before letting a probe through
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("DASHBOARD_BREAKER_COOLDOWN", "30"))
+# Oldest last good result served without waiting while Supabase is healthy (any age while it fails)
+STALE_MAX_AGE_SECONDS = float(os.getenv("DASHBOARD_STALE_MAX_AGE", "900"))
+# Last good results kept per process (least recently used dropped first)
+STALE_MAX_ENTRIES = int(os.getenv("DASHBOARD_STALE_MAX_ENTRIES", "64"))
+# Background refreshes running at once
+REFRESH_WORKERS = 2
+# Response statuses counted as failures: rate limiting, and server errors such as statement timeouts
+_FAILURE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker shared by every request of the process"""
+
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def before_request(self) -> None:
+        """Raise ``CircuitOpenError`` unless a request may be sent now"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(
+                    f"Supabase circuit open after {self._consecutive} failed requests; retrying in {max(remaining, 0):.0f}s"
+                )
+            # Half open: this request is the probe
+            self._probing = True
+
+    def record(self, ok: bool) -> None:
+        """Count the outcome of a request that was sent"""
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+
+    def retry_in(self) -> Optional[float]:
+        """Seconds until an open circuit lets a probe through (0 when due), or None when closed"""
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN_SECONDS)
+
+
+class BreakerTransport(httpx.BaseTransport):
+    """httpx transport that sends through ``transport`` only while ``breaker`` allows it"""
+
+    def __init__(self, transport: httpx.BaseTransport, breaker: CircuitBreaker):
+        self._transport = transport
+        self._breaker = breaker
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._breaker.before_request()
+        try:
+            response = self._transport.handle_request(request)
+        except httpx.TransportError:
+            self._breaker.record(ok=False)
+            raise
+        self._breaker.record(ok=response.status_code not in _FAILURE_STATUSES)
+        return response
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+# query key -> (last good value, time it was fetched, cache version it was fetched for, tables it reads)
+_last_good: "OrderedDict[tuple, Tuple[Any, float, tuple, FrozenSet[str]]]" = OrderedDict()
+_refreshing: set = set()
+# Bumped by forget() so refreshes started before an invalidation do not store old data
+_store_epoch = 0
+_store_lock = threading.Lock()
+_local = threading.local()
+
+
+@st.cache_resource
+def _get_refresh_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="stale-refresh")
+
+
+@contextmanager
+def fresh() -> Iterator[None]:
+    """Within the block, ``serve`` on this thread waits for current results instead of returning stale ones"""
+    previous = getattr(_local, "fresh", False)
+    _local.fresh = True
+    try:
+        yield
+    finally:
+        _local.fresh = previous
+
+
+def _private(value: Any) -> Any:
+    """A copy of ``value`` that changes made through the original cannot reach, and vice versa
+
+    DataFrames share their data: under pandas copy-on-write a shallow copy is
+    duplicated only when one side writes to it. Other values (KPI dicts) are small
+    and deep-copied.
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    return copy.deepcopy(value)
+
+
+def _remember(key: tuple, value: Any, version: tuple, tables: FrozenSet[str], epoch: int) -> None:
+    with _store_lock:
+        if epoch != _store_epoch:
+            return
+        entry = _last_good.get(key)
+        if entry is None or entry[2] != version:
+            # One private copy per version; callers may modify the value they were given
+            _last_good[key] = (_private(value), time.time(), version, tables)
+        _last_good.move_to_end(key)
+        while len(_last_good) > STALE_MAX_ENTRIES:
+            _last_good.popitem(last=False)
+
+
+def _schedule_refresh(key: tuple, version: tuple, tables: FrozenSet[str], refresh: Callable[[tuple], Any]) -> None:
+    with _store_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        epoch = _store_epoch
+
+    def run() -> None:
+        try:
+            with fresh():
+                _remember(key, refresh(version), version, tables, epoch)
+        except Exception:
+            pass  # The last good result stays; the next render schedules another attempt
+        finally:
+            with _store_lock:
+                _refreshing.discard(key)
+
+    _get_refresh_executor().submit(run)
+
+
+def serve(
+    key: tuple,
+    label: str,
+    tables: Iterable[str],
+    version: tuple,
+    compute: Callable[[tuple], Any],
+    refresh: Optional[Callable[[tuple], Any]] = None,
+) -> Any:
+    """``compute(version)``, or the last good result of ``key`` while a current one is unavailable
+
+    ``version`` is the cache version the result must belong to and ``tables``
+    the tables it reads (for ``forget``). A last good result from an earlier
+    version is returned at once, and recorded under ``label`` for the stale
+    notice, while ``refresh(version)`` (default ``compute``) runs in the
+    background, provided it is at most ``STALE_MAX_AGE_SECONDS`` old or the
+    circuit is open. When ``compute`` raises, the last good result of any age
+    is returned instead, or the error re-raised if there is none.
+    """
+    tables = frozenset(tables)
+    with _store_lock:
+        entry = _last_good.get(key)
+        epoch = _store_epoch
+    waiting = getattr(_local, "fresh", False)
+    if entry is not None and entry[2] != version and not waiting:
+        age = time.time() - entry[1]
+        if age <= STALE_MAX_AGE_SECONDS or breaker.retry_in() is not None:
+            _schedule_refresh(key, version, tables, refresh or compute)
+            record_stale(label, age)
+            return _private(entry[0])
+    try:
+        value = compute(version)
+    except Exception:
+        if entry is None:
+            raise
+        record_stale(label, time.time() - entry[1])
+        return _private(entry[0])
+    _remember(key, value, version, tables, epoch)
+    return value
+
+
+def forget(tables: Optional[Iterable[str]] = None) -> None:
+    """Drop the last good results reading any of ``tables`` (every result when None)"""
+    global _store_epoch
+    with _store_lock:
+        _store_epoch += 1
+        if tables is None:
+            _last_good.clear()
+            return
+        tables = set(tables)
+        for key in [k for k, entry in _last_good.items() if entry[3] & tables]:
+            del _last_good[key]
+
+
+def _age_text(seconds: float) -> str:
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def render_stale_notice(placeholder) -> None:
+    """Fill ``placeholder`` (an ``st.empty``) with a note on stale data shown in this render, if any"""
+    reads: Dict[str, float] = stale_reads()
+    retry_in = breaker.retry_in()
+    if not reads and retry_in is None:
+        placeholder.empty()
+        return
+    parts = []
+    if reads:
+        listed = ", ".join(f"{label} ({_age_text(age)} old)" for label, age in sorted(reads.items()))
+        parts.append(f"Showing the last loaded data for {listed} while it refreshes in the background.")
+    if retry_in is not None:
+        parts.append(f"Supabase is not responding; requests are paused (next attempt in {retry_in:.0f}s).")
+    placeholder.info(" ".join(parts), icon="⏳")
@@ -0,0 +1,117 @@
+"""
+Daily lead rollup behind the Overall and CRE Performance tabs.
+
+``lead_daily_rollup`` (see dashboard_rollups.sql) holds per day x basis x branch x
+PS x CRE x source counts, so a date window is answered by summing a few hundred
+rows instead of downloading every lead in it. Until the table is installed the
+same rows are aggregated client-side from ``lead_master``.
+
+Run ``python rollups.py [--since YYYY-MM-DD]`` (with ``SUPABASE_SERVICE_ROLE_KEY``
+set) to refresh the rollup from a scheduler.
+"""
+
+import argparse
+import os
+from typing import Optional
+
+import pandas as pd
+
+from data_access import fetch_table, init_supabase, invalidate
+
+ROLLUP_TABLE = "lead_daily_rollup"
+ROLLUP_REFRESH_RPC = "refresh_lead_daily_rollup"
+# Timestamp each basis takes its day from
+ROLLUP_BASES = ("created_at", "ps_assigned_at")
+ROLLUP_DIMENSIONS = ["branch", "ps_name", "cre_name", "source"]
+ROLLUP_METRICS = [
+    "leads", "assigned_cre", "ql", "pending", "won", "lost", "td", "untouched", "open", "tat_sum", "tat_count",
+]
+# lead_master columns the client-side rollup is built from
+LEAD_COLUMNS = [
+    "source", "branch", "cre_name", "ps_name", "created_at", "ps_assigned_at",
+    "lead_status", "final_status", "first_call_date", "test_drive_status", "tat",
+]
+# PostgREST / Postgres error codes meaning the table does not exist
+_MISSING_TABLE_CODES = {"PGRST205", "42P01"}
+
+# Flipped off once Supabase reports the rollup table is missing, so later renders skip it
+_rollup_available = True
+
+
+def rollup_from_rows(leads: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate ``lead_master`` rows as ``fetch_table`` returns them into ``lead_daily_rollup`` rows"""
+    columns = ["day", "basis"] + ROLLUP_DIMENSIONS + ROLLUP_METRICS
+    if leads.empty:
+        return pd.DataFrame(columns=columns)
+    final_status = leads["final_status"]
+    tat = pd.to_numeric(leads["tat"], errors="coerce")
+    metrics = pd.DataFrame({
+        "leads": 1,
+        "assigned_cre": leads["cre_name"].notna(),
+        "ql": leads["ps_name"].notna(),
+        "pending": final_status == "pending",
+        "won": final_status == "won",
+        "lost": final_status == "lost",
+        "td": leads["test_drive_status"] == "true",
+        # Status flags classified at load by data_access
+        "untouched": leads["is_untouched"],
+        "open": leads["is_open"],
+        "tat_sum": tat.fillna(0.0),
+        "tat_count": tat.notna(),
+    }, index=leads.index).astype({m: int for m in ROLLUP_METRICS if m != "tat_sum"})
+    parts = []
+    for basis in ROLLUP_BASES:
+        keyed = pd.concat([leads[ROLLUP_DIMENSIONS], metrics], axis=1)
+        keyed["day"] = leads[basis].dt.floor("D")
+        parts.append(
+            keyed.groupby(["day"] + ROLLUP_DIMENSIONS, observed=True, dropna=False)[ROLLUP_METRICS]
+            .sum()
+            .reset_index()
+            .assign(basis=basis)
+        )
+    return pd.concat(parts, ignore_index=True)[columns]
+
+
+def fetch_lead_rollup(start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> pd.DataFrame:
+    """Rollup rows whose day falls in the window (every row for ``None`` bounds)
+
+    ``start`` must be a UTC midnight, as the global date filter produces, so day
+    buckets cover the window exactly. Views filter on ``basis`` and sum metrics.
+    """
+    global _rollup_available
+    if _rollup_available:
+        try:
+            return fetch_table(
+                ROLLUP_TABLE, ["day", "basis"] + ROLLUP_DIMENSIONS + ROLLUP_METRICS,
+                date_col="day", start=start, end=end,
+            )
+        except Exception as err:
+            if getattr(err, "code", None) not in _MISSING_TABLE_CODES:
+                raise
+            _rollup_available = False
+    leads = fetch_table("lead_master", LEAD_COLUMNS, date_col=list(ROLLUP_BASES), start=start, end=end)
+    rollup = rollup_from_rows(leads)
+    if start is not None and end is not None:
+        # Leads matched on one basis fall outside the window on the other
+        rollup = rollup[rollup["day"].between(start, end)].reset_index(drop=True)
+    return rollup
+
+
+def refresh_rollup(since: Optional[pd.Timestamp] = None, client=None) -> int:
+    """Rebuild rollup days from ``since`` (everything when None); returns rows written"""
+    client = client or init_supabase()
+    since_iso = None if since is None else pd.Timestamp(since).isoformat()
+    res = client.rpc(ROLLUP_REFRESH_RPC, {"p_since": since_iso}).execute()
+    invalidate(ROLLUP_TABLE)
+    return int(res.data or 0)
+
+
+if __name__ == "__main__":
+    from supabase_client import create_supabase_client
+
+    parser = argparse.ArgumentParser(description="Refresh the lead_daily_rollup table")
+    parser.add_argument("--since", help="Rebuild days on or after this UTC date (YYYY-MM-DD); default: everything")
+    args = parser.parse_args()
+    service_client = create_supabase_client(key=os.environ["SUPABASE_SERVICE_ROLE_KEY"])
+    since_ts = pd.Timestamp(args.since, tz="UTC") if args.since else None
+    print(f"{refresh_rollup(since_ts, client=service_client)} rollup rows written")
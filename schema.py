@@ -0,0 +1,110 @@
+"""
+Column registry of the Supabase tables, probed once per process.
+
+Queries and views look columns up here before building a request, instead of
+sending one and falling back to another column when it fails. Columns come from,
+in order: the checked-in ``schema.json`` (``DASHBOARD_SCHEMA_FILE``), PostgREST's
+OpenAPI description (one request for every exposed table) or, where that is not
+published, one sampled row of the table. Write the file from a live project with::
+
+    python schema.py --output schema.json
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, FrozenSet, Optional, Sequence
+
+import streamlit as st
+
+from data_access import init_supabase
+
+# Checked-in table -> columns mapping; takes precedence over probing
+SCHEMA_FILE = os.getenv("DASHBOARD_SCHEMA_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.json"))
+# Tables the dashboard reads
+DASHBOARD_TABLES = ("lead_master", "walkin_table", "ps_followup_master", "activity_leads", "users")
+# Statuses meaning the OpenAPI description is not published to this key
+_UNPUBLISHED_STATUSES = {401, 403, 404}
+
+
+@st.cache_resource(show_spinner=False)
+def _file_schema() -> Dict[str, FrozenSet[str]]:
+    if not os.path.exists(SCHEMA_FILE):
+        return {}
+    with open(SCHEMA_FILE) as f:
+        return {table: frozenset(columns) for table, columns in json.load(f).items()}
+
+
+@st.cache_resource(show_spinner=False)
+def _published_schema() -> Dict[str, FrozenSet[str]]:
+    # Swagger 2.0 document at the API root; "definitions" holds each table's properties
+    response = init_supabase().postgrest.session.get("/")
+    if response.status_code in _UNPUBLISHED_STATUSES:
+        return {}
+    response.raise_for_status()
+    definitions = response.json().get("definitions") or {}
+    return {table: frozenset((spec.get("properties") or {}).keys()) for table, spec in definitions.items()}
+
+
+@st.cache_resource(show_spinner=False)
+def _sampled_columns(table: str) -> Optional[FrozenSet[str]]:
+    # An empty table has no row to read columns from; it stays unknown
+    rows = init_supabase().table(table).select("*").limit(1).execute().data
+    return frozenset(rows[0]) if rows else None
+
+
+def _probed_columns(table: str) -> Optional[FrozenSet[str]]:
+    try:
+        published = _published_schema()
+        if published:
+            return published.get(table, frozenset())
+        return _sampled_columns(table)
+    except Exception:
+        return None
+
+
+def table_columns(table: str) -> Optional[FrozenSet[str]]:
+    """Columns of ``table``, or None when they cannot be determined
+
+    Probes are cached per process; a failed probe (e.g. a network error) is not,
+    so the next call retries it. A table missing from a published description
+    has no columns.
+    """
+    schema = _file_schema()
+    if table in schema:
+        return schema[table]
+    return _probed_columns(table)
+
+
+def has_column(table: str, column: str) -> bool:
+    """Whether ``table`` has ``column``; assumed so when the schema is unknown, leaving the query to report it"""
+    columns = table_columns(table)
+    return columns is None or column in columns
+
+
+def first_column(table: str, candidates: Sequence[str]) -> str:
+    """The first of ``candidates`` that ``table`` has (the first candidate when none or the schema is unknown)"""
+    columns = table_columns(table)
+    if columns is None:
+        return candidates[0]
+    return next((col for col in candidates if col in columns), candidates[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the dashboard tables' columns as a schema file")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+    schema = {}
+    for table in DASHBOARD_TABLES:
+        columns = _probed_columns(table)
+        if columns is None:
+            print(f"Could not determine the columns of {table}", file=sys.stderr)
+            continue
+        schema[table] = sorted(columns)
+    text = json.dumps(schema, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -5,7 +5,7 @@ Run this script once to set up the authentication system
 
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase_client import create_supabase_client
 
 # Load environment variables
 load_dotenv()
@@ -22,7 +22,7 @@ def setup_supabase_auth():
         return False
     
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+        supabase = create_supabase_client(SUPABASE_URL, SUPABASE_ANON_KEY)
         
         # Read the SQL file
         with open('create_users_table.sql', 'r') as f:
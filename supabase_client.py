@@ -0,0 +1,80 @@
+"""
+The one place Supabase clients are created.
+
+supabase-py gives each client a default httpx session (HTTP/1.1, a small
+keep-alive pool with 5 s idle expiry, 120 s timeouts). ``create_supabase_client``
+swaps the PostgREST session for a pooled, keep-alive one sized for the
+dashboard's concurrent query fan-out, with HTTP/2 when the ``h2`` package is
+installed, explicit timeouts and the circuit breaker of resilience.py. The app
+(``data_access.init_supabase``, one client per process), the rollup refresh and
+the setup/diagnostic scripts all build their clients here. Responses are gzip-compressed by Supabase; httpx asks
+for and decodes that by default.
+"""
+
+import importlib.util
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from postgrest.utils import SyncClient
+from supabase import Client, create_client
+from supabase.lib.client_options import ClientOptions
+
+from resilience import BreakerTransport, breaker
+
+load_dotenv()
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
+
+# Open connections per client; above DASHBOARD_QUERY_WORKERS + DASHBOARD_PAGE_WORKERS plus script threads
+HTTP_MAX_CONNECTIONS = int(os.getenv("DASHBOARD_HTTP_MAX_CONNECTIONS", "32"))
+# Seconds an idle connection is kept for reuse (httpx default: 5, shorter than the gap between reruns)
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("DASHBOARD_HTTP_KEEPALIVE", "120"))
+# Seconds allowed to open a connection, and for each read/write/pool wait of a request
+HTTP_CONNECT_TIMEOUT = float(os.getenv("DASHBOARD_HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("DASHBOARD_HTTP_TIMEOUT", "60"))
+# Multiplex requests over one connection per host; needs the optional h2 package
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+HTTP2_ENABLED = os.getenv("DASHBOARD_HTTP2", "1") == "1" and HTTP2_AVAILABLE
+
+
+def _transport() -> httpx.BaseTransport:
+    pool = httpx.HTTPTransport(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+        ),
+        http2=HTTP2_ENABLED,
+    )
+    # Requests fail fast while Supabase is failing (see resilience.py)
+    return BreakerTransport(pool, breaker)
+
+
+def create_supabase_client(url: Optional[str] = None, key: Optional[str] = None) -> Client:
+    """Supabase client for ``url``/``key`` (default: the project URL and anon key) on the tuned transport
+
+    The PostgREST session (tables and RPCs, everything the dashboard queries)
+    is replaced; its base URL and auth headers are kept. Its requests go
+    through the process-wide circuit breaker. Create one client per
+    process and share it: the pool is thread-safe, and reusing its connections
+    is what avoids repeated TLS handshakes.
+    """
+    timeout = httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    client = create_client(url or SUPABASE_URL, key or SUPABASE_ANON_KEY, ClientOptions(postgrest_client_timeout=timeout))
+    default_session = client.postgrest.session
+    client.postgrest.session = SyncClient(
+        base_url=default_session.base_url, headers=default_session.headers, timeout=timeout, transport=_transport(),
+    )
+    default_session.close()
+    return client
+
+
+def describe_transport() -> str:
+    """One-line summary of the transport settings, for diagnostics"""
+    http2 = "on" if HTTP2_ENABLED else ("off" if HTTP2_AVAILABLE else "off (h2 not installed)")
+    return (
+        f"HTTP/2 {http2}, {HTTP_MAX_CONNECTIONS} pooled connections kept alive {HTTP_KEEPALIVE_SECONDS:g}s, "
+        f"timeouts {HTTP_CONNECT_TIMEOUT:g}s connect / {HTTP_TIMEOUT:g}s request"
+    )
@@ -5,7 +5,7 @@ Run this to debug authentication issues
 
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase_client import create_supabase_client, describe_transport
 import hashlib
 
 def test_supabase_connection():
@@ -27,8 +27,9 @@ def test_supabase_connection():
     
     try:
         # Initialize Supabase client
-        supabase = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+        supabase = create_supabase_client(SUPABASE_URL, SUPABASE_ANON_KEY)
         print("✅ Supabase client created successfully")
+        print(f"🔌 Transport: {describe_transport()}")
         
         # Test 1: Check if users table exists
         print("\n🔍 Test 1: Checking if users table exists...")